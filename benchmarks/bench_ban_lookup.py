@@ -0,0 +1,67 @@
+"""
+NDPR 加入检查 SQLite 查询基准测试
+Benchmark for the combined join-time ban query, with and without indexes
+
+用法 / Usage:
+    python benchmarks/bench_ban_lookup.py [行数, 默认1000000]
+
+需要安装插件依赖 (mcdreforged, requests, toml)
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from common import ndpr, generate_ban_database, report
+
+
+def sample_identities(rows: int, count: int) -> list:
+    identities = []
+    for i in range(count):
+        n = random.randrange(rows // len(ndpr.BAN_TABLES))
+        if i % 10 == 0:
+            # 命中: 以 IP 匹配 offline 表中的记录
+            identities.append((f'clean{i}', None, f'10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}', None))
+        else:
+            # 未命中: 绝大多数加入的都是正常玩家, 需要走完全部判断
+            identities.append((f'clean{i}', f'{n:08x}-1111-4000-8000-{n:012x}', f'192.0.2.{i & 255}', None))
+    return identities
+
+
+def measure(identities: list) -> list:
+    samples = []
+    for identity in identities:
+        start = time.perf_counter()
+        ndpr.query_ban_match(*identity)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'ban_database.db')
+        print(f'生成 {rows} 行测试数据库...')
+        generate_ban_database(db_path, rows)
+        ndpr.config = {}
+        ndpr.ban_db_path = db_path
+
+        ndpr.ban_db_version += 1
+        report('无索引', measure(sample_identities(rows, 20)))
+
+        conn = sqlite3.connect(db_path)
+        start = time.perf_counter()
+        ndpr.create_ban_db_indexes(conn)
+        conn.commit()
+        conn.close()
+        print(f'建立索引耗时 {time.perf_counter() - start:.1f} s')
+
+        ndpr.ban_db_version += 1
+        report('有索引', measure(sample_identities(rows, 20000)))
+
+
+if __name__ == '__main__':
+    main()
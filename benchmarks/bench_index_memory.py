@@ -0,0 +1,71 @@
+"""
+NDPR 封禁索引内存占用基准测试
+Memory benchmark for the packed ban index versus a naive dict index
+
+用法 / Usage:
+    python benchmarks/bench_index_memory.py [行数, 默认 100000 和 1000000]
+
+需要安装插件依赖 (mcdreforged, requests, toml)
+"""
+import gc
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from common import ndpr, generate_ban_database
+
+
+def legacy_build_ban_index(db_path: str) -> dict:
+    # 旧实现: 每个字段一个 值 -> 行数 的字典
+    conn = sqlite3.connect(db_path)
+    try:
+        index = {}
+        for table in ndpr.BAN_TABLES:
+            fields = {field: {} for field in ndpr.BAN_INDEX_FIELDS}
+            for row in conn.execute(f'SELECT mcuuid, player, ip, ipv6 FROM {table}'):
+                for field, value in zip(ndpr.BAN_INDEX_FIELDS, row):
+                    if value:
+                        values = fields[field]
+                        values[value] = values.get(value, 0) + 1
+            index[table] = fields
+        return index
+    finally:
+        conn.close()
+
+
+def measure(build, db_path: str) -> tuple:
+    # tracemalloc 会显著拖慢构建, 耗时单独测量
+    gc.collect()
+    start = time.perf_counter()
+    build(db_path)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    index = build(db_path)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del index
+    return size, elapsed
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000, 1000000]
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            db_path = os.path.join(tmp, f'ban_database_{rows}.db')
+            print(f'生成 {rows} 行测试数据库...')
+            generate_ban_database(db_path, rows)
+
+            legacy_size, legacy_time = measure(legacy_build_ban_index, db_path)
+            packed_size, packed_time = measure(ndpr.build_ban_index, db_path)
+            print(f'  字典索引: {legacy_size / 1024 / 1024:.1f} MB (构建 {legacy_time:.1f} s)')
+            print(f'  紧凑索引: {packed_size / 1024 / 1024:.1f} MB (构建 {packed_time:.1f} s)')
+            print(f'  内存节省: {1 - packed_size / legacy_size:.0%}')
+
+
+if __name__ == '__main__':
+    main()
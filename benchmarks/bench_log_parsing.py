@@ -0,0 +1,77 @@
+"""
+NDPR 加入时日志解析基准测试
+Benchmark for join-time identity extraction from latest.log
+
+用法 / Usage:
+    python benchmarks/bench_log_parsing.py [日志大小MB, 默认200]
+
+需要安装插件依赖 (mcdreforged, requests, toml)
+"""
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import ndpr, generate_log, append_joins
+
+
+PLAYER = 'Steve'
+
+
+def legacy_get_player_info_from_log(log_path: str, player: str) -> dict:
+    # 旧实现: readlines() 读入整个文件后倒序逐行跑正则
+    with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
+        lines = f.readlines()
+    result = {'ip': None, 'uuid': None, 'ipv6': None}
+    five_minutes_ago = datetime.now() - timedelta(minutes=5)
+    for line in reversed(lines):
+        time_match = re.search(r'\[(\d{2}:\d{2}:\d{2})\]', line)
+        if not time_match:
+            continue
+        try:
+            log_time = datetime.strptime(time_match.group(1), '%H:%M:%S')
+            log_time = log_time.replace(year=datetime.now().year, month=datetime.now().month, day=datetime.now().day)
+            if log_time < five_minutes_ago:
+                continue
+        except ValueError:
+            continue
+        if player in line and ('UUID' in line or 'uuid' in line):
+            uuid_match = re.search(r'UUID of player (\w+) is ([a-fA-F0-9-]{36})', line)
+            if uuid_match and uuid_match.group(1) == player:
+                result['uuid'] = uuid_match.group(2)
+                continue
+        if player in line and ('joined' in line or 'logged' in line):
+            ip_match = re.search(rf'{re.escape(player)}\[/([0-9.:]+):', line)
+            if ip_match:
+                result['ip'] = ip_match.group(1)
+    return result
+
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, 'latest.log')
+        print(f'生成 {size_mb} MB 测试日志...')
+        generate_log(log_path, size_mb)
+        append_joins(log_path, [(PLAYER, '069a79f4-44e9-4726-a5be-fca90e38aaf5', '203.0.113.7')])
+        ndpr.config = {'log_path': log_path}
+
+        # 旧的加入流程对 uuid / ip / ipv6 各扫描一次日志
+        legacy = sum(timed(legacy_get_player_info_from_log, log_path, PLAYER) for _ in range(3))
+        current = timed(ndpr.get_player_info_from_log, PLAYER)
+
+        print(f'旧实现 (3 次全量扫描): {legacy * 1000:.1f} ms')
+        print(f'新实现 (单次倒序扫描): {current * 1000:.1f} ms')
+        print(f'加速比: {legacy / current:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+NDPR 自定义日志格式解析基准测试
+Microbenchmark for the compiled logger_format matcher (lines/second)
+
+用法 / Usage:
+    python benchmarks/bench_logger_format.py [行数, 默认500000]
+
+需要安装插件依赖 (mcdreforged, requests, toml)
+"""
+import sys
+import time
+
+from common import ndpr
+
+
+CUSTOM_FORMAT = '<[%n%]%name%>%s%<%message%>'
+
+
+def generate_default_lines(count: int) -> list:
+    lines = []
+    for i in range(count):
+        if i % 50 == 0:
+            lines.append(f'[12:00:00] [User Authenticator #1/INFO]: UUID of player Player{i} is 069a79f4-44e9-4726-a5be-fca90e38aaf5')
+        elif i % 50 == 1:
+            lines.append(f'[12:00:00] [Server thread/INFO]: Player{i}[/203.0.113.{i % 256}:52314] logged in with entity id {i}')
+        else:
+            lines.append(f'[12:00:00] [Server thread/INFO]: <Player{i % 97}> chatting about nothing in particular #{i}')
+    return lines
+
+
+def generate_custom_lines(count: int) -> list:
+    lines = []
+    for i in range(count):
+        if i % 50 == 0:
+            lines.append(f'[12:00:00] [User Authenticator #1/INFO]: UUID of player <[VIP]Player{i}> is 069a79f4-44e9-4726-a5be-fca90e38aaf5')
+        elif i % 50 == 1:
+            lines.append(f'[12:00:00] [Server thread/INFO]: <[VIP]Player{i}>[/203.0.113.{i % 256}:52314] logged in with entity id {i}')
+        else:
+            lines.append(f'[12:00:00] [Server thread/INFO]: <[VIP]Player{i % 97}> <chatting about nothing in particular #{i}>')
+    return lines
+
+
+def lines_per_second(lines: list) -> float:
+    parse = ndpr.parse_identity_line
+    start = time.perf_counter()
+    for line in lines:
+        parse(line)
+    return len(lines) / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+
+    ndpr.custom_log_matcher = None
+    default_rate = lines_per_second(generate_default_lines(count))
+
+    ndpr.custom_log_matcher = ndpr.compile_logger_name_format(CUSTOM_FORMAT)
+    custom_rate = lines_per_second(generate_custom_lines(count))
+
+    print(f'默认格式: {default_rate:,.0f} 行/秒')
+    print(f'自定义格式 ({CUSTOM_FORMAT}): {custom_rate:,.0f} 行/秒')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+NDPR 封禁数据库跳过下载检查: 对本地替身 API 验证 ETag 304、版本号一致和版本变化三种情况
+Reproducible check of the refresh skip paths against a local stand-in API
+
+用法 / Usage:
+    python benchmarks/check_download_skip.py
+
+全部通过时退出码为 0, 否则为 1
+需要安装插件依赖 (mcdreforged, requests, toml)
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+from common import ndpr, setup_plugin, teardown_plugin, generate_ban_database, start_ban_api
+
+
+def database_bytes(folder: str, rows: int) -> bytes:
+    path = os.path.join(folder, f'source_{rows}.db')
+    generate_ban_database(path, rows)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def ban_count(path: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return sum(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in ndpr.BAN_TABLES)
+    finally:
+        conn.close()
+
+
+def refresh(server, handler) -> tuple:
+    # 返回 (是否成功, 本次请求的路径列表, 是否发布了新数据库)
+    handler.requests.clear()
+    version = ndpr.ban_db_version
+    ok = ndpr.download_ban_database(server)
+    paths = [path for path, _, _ in handler.requests if path in ('/bans/download', '/file')]
+    return ok, paths, ndpr.ban_db_version != version
+
+
+def run_case(tmp: str, name: str, attributes: dict, change) -> list:
+    folder = os.path.join(tmp, name)
+    os.makedirs(folder)
+    httpd, handler = start_ban_api(database_bytes(folder, 100), **attributes)
+    server = setup_plugin(folder, api_url=f'http://127.0.0.1:{httpd.server_address[1]}')
+    failures = []
+    try:
+        ok, _, published = refresh(server, handler)
+        if not ok or not published:
+            failures.append('首次下载未发布数据库')
+
+        ok, paths, published = refresh(server, handler)
+        expected = change['unchanged_paths']
+        if not ok or published or paths != expected:
+            failures.append(f'无变化时应跳过: 请求 {paths} (期望 {expected}), 发布 {published}')
+
+        for key, value in change['server'].items():
+            setattr(handler, key, value)
+        handler.database = database_bytes(folder, 200)
+        ok, paths, published = refresh(server, handler)
+        if not ok or not published or paths != ['/bans/download', '/file']:
+            failures.append(f'版本变化后应完整下载: 请求 {paths}, 发布 {published}')
+        elif ban_count(ndpr.ban_db_path) != 200:
+            failures.append(f'更新后的数据库记录数为 {ban_count(ndpr.ban_db_path)} (期望 200)')
+    finally:
+        teardown_plugin(server)
+        httpd.shutdown()
+        httpd.server_close()
+    return failures
+
+
+CASES = {
+    # 文件响应带 ETag, 第二次请求文件时收到 304
+    'file_etag_304': ({'file_etag': '"v1"'}, {'unchanged_paths': ['/bans/download', '/file'],
+                                              'server': {'file_etag': '"v2"'}}),
+    # 接口响应带 ETag, 第二次请求接口时收到 304, 不再请求文件
+    'api_etag_304': ({'api_etag': '"v1"'}, {'unchanged_paths': ['/bans/download'],
+                                            'server': {'api_etag': '"v2"'}}),
+    # 接口返回的版本号与本地一致, 不再请求文件
+    'version_match': ({'version': 'v1'}, {'unchanged_paths': ['/bans/download'],
+                                          'server': {'version': 'v2'}}),
+}
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        failed = False
+        for name, (attributes, change) in CASES.items():
+            failures = run_case(tmp, name, attributes, change)
+            print(f'{name}: {"通过" if not failures else "失败"}')
+            for failure in failures:
+                print(f'  - {failure}')
+            failed = failed or bool(failures)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
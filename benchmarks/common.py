@@ -0,0 +1,260 @@
+"""
+NDPR 基准测试公共工具: 测试数据生成、MCDR 替身对象和统计
+Shared helpers for the benchmarks: synthetic data generators, MCDR stubs and statistics
+"""
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import sys
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ndpr  # noqa: E402
+
+
+DEFAULT_CONFIG = {
+    'api_url': 'http://127.0.0.1:1',
+    'token': 'benchmark',
+    'uuid': 'benchmark',
+    'onlinemode': True,
+    'logger_mode': 'default',
+    'logger_format': '<[%n%]%name%>%s%<%message%>',
+    'download_interval': 900,
+    'delta_sync': False,
+    'http_gzip': True,
+    # 重复的加入检查会命中判定缓存, 基准测试测量的是未缓存的完整路径
+    'verdict_cache_size': 0,
+}
+
+
+class StubLogger:
+    # 丢弃所有日志, 避免输出耗时计入测量结果
+    def __init__(self):
+        self.logger = logging.getLogger('ndpr.benchmark')
+        self.logger.addHandler(logging.NullHandler())
+        self.logger.propagate = False
+
+    def __getattr__(self, name):
+        return getattr(self.logger, name)
+
+
+class StubServer:
+    # 模拟 PluginServerInterface 中插件用到的部分
+    def __init__(self, data_folder: str):
+        self.data_folder = data_folder
+        self.logger = StubLogger()
+        self.executed = []
+
+    def get_data_folder(self) -> str:
+        return self.data_folder
+
+    def execute(self, command: str):
+        self.executed.append(command)
+
+    def register_help_message(self, *args, **kwargs):
+        pass
+
+    def register_event_listener(self, *args, **kwargs):
+        pass
+
+    def register_command(self, *args, **kwargs):
+        pass
+
+
+class StubSource:
+    def __init__(self, server: StubServer):
+        self.server = server
+        self.replies = []
+
+    def reply(self, message):
+        self.replies.append(message)
+
+    def get_server(self) -> StubServer:
+        return self.server
+
+
+class StubInfo:
+    def __init__(self, content: str = ''):
+        self.content = content
+        self.is_from_server = True
+        self.is_user = False
+        self.is_player = False
+
+
+def setup_plugin(data_folder: str, **overrides) -> StubServer:
+    # 不经过 on_load: 跳过 UUID 获取、后台下载和更新检查, 只初始化被测的部分
+    server = StubServer(data_folder)
+    data_dir = os.path.join(data_folder, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    ndpr.config = dict(DEFAULT_CONFIG, log_path=os.path.join(data_folder, 'latest.log'), **overrides)
+    ndpr.data_dir = data_dir
+    ndpr.ban_db_path = os.path.join(data_dir, 'ban_database.db')
+    ndpr.ban_db_meta_path = os.path.join(data_dir, 'ban_database.json')
+    ndpr.player_info_path = os.path.join(data_dir, 'player_info.json')
+    ndpr.player_db_path = os.path.join(data_dir, 'player_info.db')
+    ndpr.kick_stats_path = os.path.join(data_dir, 'kick_stats.json')
+    ndpr.load_ban_db_meta(server)
+    ndpr.init_player_store(server)
+    ndpr.start_player_writer(server)
+    ndpr.init_http_session(server)
+    ndpr.setup_logger(server)
+    ndpr.startup_complete.set()
+    return server
+
+
+def teardown_plugin(server: StubServer):
+    if ndpr.log_tailer is not None:
+        ndpr.log_tailer.close()
+        ndpr.log_tailer = None
+    ndpr.stop_player_writer(server)
+    ndpr.close_player_store()
+    ndpr.close_http_session()
+    ndpr.ban_index = None
+    ndpr.ban_bloom = None
+    ndpr.ban_db_meta = {}
+    with ndpr.ban_db_conn_lock:
+        ndpr.close_ban_db_connection()
+    ndpr.clear_verdict_cache()
+    ndpr.recent_identities.clear()
+    ndpr.checked_logins.clear()
+
+
+class BanApiHandler(BaseHTTPRequestHandler):
+    """
+    本地替身 API: /bans/download 返回文件地址, /file 返回数据库内容
+    version / api_etag / file_etag 不为空时分别返回版本号和 ETag, 请求带上相同的 If-None-Match 则回复 304
+    """
+    database = b''
+    version = None
+    api_etag = None
+    file_etag = None
+    requests = None
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if_none_match = self.headers.get('If-None-Match')
+        self.requests.append((path, self.path, if_none_match))
+        headers = {}
+        if path == '/bans/download':
+            if self.api_etag and if_none_match == self.api_etag:
+                return self.reply(304, b'')
+            payload = {'url': f'http://127.0.0.1:{self.server.server_address[1]}/file'}
+            if self.version:
+                payload['version'] = self.version
+            body = json.dumps(payload).encode()
+            if self.api_etag:
+                headers['ETag'] = self.api_etag
+        elif path == '/file':
+            if self.file_etag and if_none_match == self.file_etag:
+                return self.reply(304, b'')
+            body = self.database
+            if self.file_etag:
+                headers['ETag'] = self.file_etag
+        else:
+            body = b'{}'
+        self.reply(200, body, headers)
+
+    do_POST = do_GET
+
+    def reply(self, status: int, body: bytes, headers: dict = None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_ban_api(database: bytes, **attributes) -> tuple:
+    # 每次启动使用独立的子类, 测试中直接修改返回的 handler 属性即可改变服务端行为
+    handler = type('Handler', (BanApiHandler,), dict(database=database, requests=[], **attributes))
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, handler
+
+
+def ban_row(table: str, i: int) -> tuple:
+    return (
+        f'{table}_player{i}',
+        f'{i:08x}-0000-4000-8000-{i:012x}',
+        f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}',
+        f'2001:db8::{i:x}' if i % 10 == 0 else None,
+        'benchmark',
+        '2026-01-01 00:00:00',
+    )
+
+
+def generate_ban_database(path: str, rows: int, indexes: bool = False):
+    # online / offline 两张表各占一半记录
+    conn = sqlite3.connect(path)
+    for table in ndpr.BAN_TABLES:
+        conn.execute(f'CREATE TABLE {table} (id INTEGER PRIMARY KEY, player TEXT, mcuuid TEXT, ip TEXT, '
+                     f'ipv6 TEXT, ban_reason TEXT, ban_time TEXT)')
+        conn.executemany(
+            f'INSERT INTO {table} (player, mcuuid, ip, ipv6, ban_reason, ban_time) VALUES (?, ?, ?, ?, ?, ?)',
+            (ban_row(table, i) for i in range(rows // len(ndpr.BAN_TABLES)))
+        )
+    if indexes:
+        ndpr.create_ban_db_indexes(conn)
+    conn.commit()
+    conn.close()
+
+
+def chat_line(timestamp: str, i: int) -> str:
+    return f'[{timestamp}] [Server thread/INFO]: <Player{i % 97}> chatting about nothing in particular #{i}\n'
+
+
+def join_lines(timestamp: str, player: str, player_uuid: str, ip: str) -> str:
+    return (
+        f'[{timestamp}] [User Authenticator #1/INFO]: UUID of player {player} is {player_uuid}\n'
+        f'[{timestamp}] [Server thread/INFO]: {player}[/{ip}:52314] logged in with entity id 42\n'
+        f'[{timestamp}] [Server thread/INFO]: {player} joined the game\n'
+    )
+
+
+def generate_log(path: str, size_mb: float, start_minutes: int = 30, end_minutes: int = 1):
+    # 聊天记录的时间戳从 start_minutes 分钟前均匀增长到 end_minutes 分钟前
+    now = datetime.now()
+    target = int(size_mb * 1024 * 1024)
+    block_lines = 1000
+    block_size = len(''.join(chat_line('00:00:00', i) for i in range(block_lines)).encode('utf-8'))
+    blocks = max(1, target // block_size)
+    span = timedelta(minutes=start_minutes - end_minutes)
+    with open(path, 'w', encoding='utf-8') as f:
+        for block in range(blocks):
+            timestamp = (now - timedelta(minutes=start_minutes) + span * block / blocks).strftime('%H:%M:%S')
+            f.write(''.join(chat_line(timestamp, i) for i in range(block_lines)))
+
+
+def append_joins(path: str, players: list):
+    # players: [(玩家名, UUID, IP), ...], 时间戳为当前时间
+    timestamp = datetime.now().strftime('%H:%M:%S')
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(''.join(join_lines(timestamp, *player) for player in players))
+
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'mean': statistics.mean(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p99': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        'max': ordered[-1],
+    }
+
+
+def report(label: str, samples: list, unit: str = 'µs'):
+    stats = percentiles(samples)
+    print(f'{label}: 平均 {stats["mean"]:.1f} {unit}, p50 {stats["p50"]:.1f} {unit}, p99 {stats["p99"]:.1f} {unit} '
+          f'({stats["count"]} 次)')
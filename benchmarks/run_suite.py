@@ -0,0 +1,310 @@
+"""
+NDPR 基准测试套件: 加入检查流程、日志解析、玩家信息写入和封禁数据库刷新
+Benchmark suite for the join pipeline, log parsing, player store writes and ban database refresh
+
+用法 / Usage:
+    python benchmarks/run_suite.py                                   # 快速运行 (1 / 50 MB 日志, 1万 / 10万行数据库)
+    python benchmarks/run_suite.py --log-sizes 1 100 500 --db-rows 10000 100000 1000000
+    python benchmarks/run_suite.py --only join download --output results.json
+    python benchmarks/run_suite.py --compare benchmarks/results/上一次的结果.json
+
+结果以 JSON 保存 (默认 benchmarks/results/<时间>.json), 可用 --compare 与之前的结果对比
+
+需要安装插件依赖 (mcdreforged, requests, toml)
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from common import (ndpr, StubInfo, setup_plugin, teardown_plugin, generate_ban_database, generate_log,
+                    append_joins, ban_row, percentiles, start_ban_api)
+
+
+SCENARIOS = ('log', 'join', 'store', 'download')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def quiet():
+    # 日志回退扫描会 print 调试信息, 测量时丢弃
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def bench_log(tmp: str, size_mb: float) -> dict:
+    folder = os.path.join(tmp, f'log_{size_mb}')
+    server = setup_plugin(folder)
+    log_path = ndpr.config['log_path']
+    try:
+        generate_log(log_path, size_mb)
+        append_joins(log_path, [('Steve', '069a79f4-44e9-4726-a5be-fca90e38aaf5', '203.0.113.7')])
+        with open(log_path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+
+        start = time.perf_counter()
+        for line in lines:
+            ndpr.parse_identity_line(line)
+        parse_rate = len(lines) / (time.perf_counter() - start)
+
+        # 放大首次回看范围, 让读取器从头解析整个文件
+        bootstrap = ndpr.LOG_TAILER_BOOTSTRAP_BYTES
+        ndpr.LOG_TAILER_BOOTSTRAP_BYTES = os.path.getsize(log_path) + 1
+        try:
+            tailer = ndpr.LogTailer(log_path)
+            start = time.perf_counter()
+            tailed = tailer.poll()
+            tailer_rate = tailed / (time.perf_counter() - start)
+            tailer.close()
+        finally:
+            ndpr.LOG_TAILER_BOOTSTRAP_BYTES = bootstrap
+
+        # 命中时找到完整身份即停止; 未命中时要扫完最近 5 分钟的全部日志
+        scans, misses = [], []
+        with quiet():
+            for _ in range(3):
+                start = time.perf_counter()
+                ndpr.get_player_info_from_log('Steve')
+                scans.append((time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                ndpr.get_player_info_from_log('Nobody')
+                misses.append((time.perf_counter() - start) * 1000)
+
+        return {
+            'size_mb': size_mb,
+            'lines': len(lines),
+            'parse_lines_per_sec': parse_rate,
+            'tailer_lines_per_sec': tailer_rate,
+            'log_scan_ms': statistics.median(scans),
+            'log_scan_miss_ms': statistics.median(misses),
+        }
+    finally:
+        teardown_plugin(server)
+
+
+def join_players(rows: int, joins: int) -> list:
+    # 每 20 次加入中有 1 名被封禁玩家 (以 IP 命中 online 表), 其余为正常玩家
+    per_table = max(1, rows // len(ndpr.BAN_TABLES))
+    players = []
+    for i in range(joins):
+        if i % 20 == 0:
+            row = ban_row('online', (i * 7919) % per_table)
+            players.append((f'Alt{i}', f'{i:08x}-2222-4000-8000-{i:012x}', row[2]))
+        else:
+            players.append((f'Clean{i}', f'{i:08x}-1111-4000-8000-{i:012x}', f'192.0.{i >> 8 & 255}.{i & 255}'))
+    return players
+
+
+def bench_join(tmp: str, rows: int, joins: int, scans: int) -> dict:
+    folder = os.path.join(tmp, f'join_{rows}')
+    server = setup_plugin(folder)
+    log_path = ndpr.config['log_path']
+    try:
+        db_path = os.path.join(folder, 'download.db')
+        generate_ban_database(db_path, rows)
+        start = time.perf_counter()
+        ndpr.publish_ban_database(server, db_path)
+        publish_s = time.perf_counter() - start
+
+        generate_log(log_path, 1)
+        ndpr.start_log_tailer(server)
+        players = join_players(rows, joins)
+
+        lookups = []
+        for player, player_uuid, ip in players:
+            start = time.perf_counter()
+            ndpr.find_ban_match(player, player_uuid, ip, None)
+            lookups.append((time.perf_counter() - start) * 1e6)
+
+        # 常规路径: 服务端先写出登录日志, 随后触发加入事件, 由日志读取器增量解析
+        tailer_joins = []
+        for player in players:
+            append_joins(log_path, [player])
+            start = time.perf_counter()
+            ndpr.on_player_joined(server, player[0], StubInfo())
+            tailer_joins.append((time.perf_counter() - start) * 1e6)
+        kicks = len(server.executed)
+
+        # 回退路径: 没有日志读取器时每次加入都倒序扫描日志文件
+        ndpr.log_tailer.close()
+        ndpr.log_tailer = None
+        scan_joins = []
+        with quiet():
+            for player in players[-scans:]:
+                start = time.perf_counter()
+                ndpr.on_player_joined(server, player[0], StubInfo())
+                scan_joins.append((time.perf_counter() - start) * 1e6)
+
+        return {
+            'rows': rows,
+            'publish_s': publish_s,
+            'find_ban_match_us': percentiles(lookups),
+            'join_tailer_us': percentiles(tailer_joins),
+            'join_log_scan_us': percentiles(scan_joins),
+            'kicks': kicks,
+        }
+    finally:
+        teardown_plugin(server)
+
+
+def bench_store(tmp: str, saves: int) -> dict:
+    folder = os.path.join(tmp, 'store')
+    server = setup_plugin(folder)
+    try:
+        enqueue = []
+        start_all = time.perf_counter()
+        for i in range(saves):
+            # 一半的更新落在重复的玩家上, 由写入线程合并
+            player = f'Player{i % (saves // 2 or 1)}'
+            start = time.perf_counter()
+            ndpr.save_player_info(player, f'192.0.2.{i & 255}', None, None)
+            enqueue.append((time.perf_counter() - start) * 1e6)
+        # 停止写入线程会落盘所有待写入的记录
+        ndpr.stop_player_writer(server)
+        total_s = time.perf_counter() - start_all
+        stored = ndpr.player_db.execute('SELECT COUNT(*) FROM players').fetchone()[0]
+        return {
+            'saves': saves,
+            'stored_players': stored,
+            'save_player_info_us': percentiles(enqueue),
+            'total_s': total_s,
+            'saves_per_sec': saves / total_s,
+        }
+    finally:
+        teardown_plugin(server)
+
+
+def bench_download(tmp: str, rows: int, repeat: int) -> dict:
+    folder = os.path.join(tmp, f'download_{rows}')
+    os.makedirs(folder, exist_ok=True)
+    source_path = os.path.join(folder, 'source.db')
+    generate_ban_database(source_path, rows)
+    with open(source_path, 'rb') as f:
+        httpd, handler = start_ban_api(f.read())
+
+    server = setup_plugin(folder, api_url=f'http://127.0.0.1:{httpd.server_address[1]}')
+    try:
+        downloads = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            if not ndpr.download_ban_database(server):
+                raise RuntimeError('封禁数据库下载失败')
+            downloads.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        ndpr.refresh_ban_index(server)
+        refresh_s = time.perf_counter() - start
+
+        return {
+            'rows': rows,
+            'size_mb': len(handler.database) / 1024 / 1024,
+            'download_publish_s': percentiles(downloads),
+            'refresh_index_s': refresh_s,
+        }
+    finally:
+        teardown_plugin(server)
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def flatten(results, prefix: str = '') -> dict:
+    values = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            values.update(flatten(value, f'{prefix}.{key}' if prefix else key))
+    elif isinstance(results, list):
+        for item in results:
+            # 按规模区分同一场景的多次结果
+            label = item.get('size_mb') if 'lines' in item else item.get('rows')
+            values.update(flatten(item, f'{prefix}[{label}]'))
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        values[prefix] = results
+    return values
+
+
+def compare(previous_path: str, results: dict):
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = flatten(json.load(f)['results'])
+    current = flatten(results)
+    print(f'\n与 {previous_path} 对比:')
+    for key in sorted(current):
+        if key not in previous or not previous[key] or previous[key] == current[key]:
+            continue
+        change = (current[key] - previous[key]) / previous[key]
+        print(f'  {key}: {previous[key]:.4g} -> {current[key]:.4g} ({change:+.1%})')
+
+
+def print_summary(results: dict):
+    for item in results.get('log', []):
+        print(f'日志 {item["size_mb"]} MB: 解析 {item["parse_lines_per_sec"]:,.0f} 行/秒, '
+              f'读取器 {item["tailer_lines_per_sec"]:,.0f} 行/秒, 回退扫描 {item["log_scan_ms"]:.1f} ms '
+              f'(未命中 {item["log_scan_miss_ms"]:.1f} ms)')
+    for item in results.get('join', []):
+        tailer, scan = item['join_tailer_us'], item['join_log_scan_us']
+        print(f'加入检查 ({item["rows"]} 行): p50 {tailer["p50"]:.0f} µs, p99 {tailer["p99"]:.0f} µs; '
+              f'日志扫描回退 p50 {scan["p50"]:.0f} µs, p99 {scan["p99"]:.0f} µs; 踢出 {item["kicks"]} 人')
+    if 'store' in results:
+        item = results['store']
+        print(f'玩家信息写入: {item["saves_per_sec"]:,.0f} 次/秒, '
+              f'入队 p99 {item["save_player_info_us"]["p99"]:.1f} µs')
+    for item in results.get('download', []):
+        print(f'数据库刷新 ({item["rows"]} 行, {item["size_mb"]:.1f} MB): '
+              f'下载+发布 p50 {item["download_publish_s"]["p50"]:.2f} s, 重建索引 {item["refresh_index_s"]:.2f} s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NDPR 基准测试套件')
+    parser.add_argument('--log-sizes', type=float, nargs='+', default=[1, 50], help='日志大小 (MB)')
+    parser.add_argument('--db-rows', type=int, nargs='+', default=[10000, 100000], help='封禁数据库行数')
+    parser.add_argument('--joins', type=int, default=2000, help='每个数据库规模模拟的加入次数')
+    parser.add_argument('--scans', type=int, default=50, help='日志扫描回退路径的加入次数')
+    parser.add_argument('--saves', type=int, default=20000, help='玩家信息写入次数')
+    parser.add_argument('--repeat', type=int, default=3, help='数据库下载重复次数')
+    parser.add_argument('--only', nargs='+', choices=SCENARIOS, default=list(SCENARIOS), help='只运行指定场景')
+    parser.add_argument('--output', help='结果文件路径')
+    parser.add_argument('--compare', help='与之前的结果文件对比')
+    args = parser.parse_args()
+
+    results = {}
+    tmp = tempfile.mkdtemp(prefix='ndpr-bench-')
+    try:
+        if 'log' in args.only:
+            results['log'] = [bench_log(tmp, size) for size in args.log_sizes]
+        if 'join' in args.only:
+            results['join'] = [bench_join(tmp, rows, args.joins, args.scans) for rows in args.db_rows]
+        if 'store' in args.only:
+            results['store'] = bench_store(tmp, args.saves)
+        if 'download' in args.only:
+            results['download'] = [bench_download(tmp, rows, args.repeat) for rows in args.db_rows]
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print_summary(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'meta': {
+                'plugin_version': ndpr.version,
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'time': datetime.now().isoformat(timespec='seconds'),
+                'args': vars(args),
+            },
+            'results': results,
+        }, f, indent=2, ensure_ascii=False)
+    print(f'\n结果已保存到 {output}')
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
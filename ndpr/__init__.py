@@ -1,10 +1,26 @@
+import hashlib
+import ipaddress
+import math
 import os
+import re
 import toml
 import json
+import queue
+import random
+import shutil
+import socket
 import requests
+from requests.adapters import HTTPAdapter
 import sqlite3
+import tempfile
 import threading
-from typing import Optional, Dict
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from urllib.request import pathname2url
+from typing import Optional, Dict, List, Tuple
 from mcdreforged import *
 from mcdreforged.api.rtext import *
 
@@ -13,46 +29,379 @@ config = None
 config_path = None
 data_dir = None
 ban_db_path = None
+ban_db_meta_path = None
+ban_db_meta = {}
 player_info_path = None
+player_db_path = None
+kick_stats_path = None
+player_db = None
+player_db_lock = threading.Lock()
+player_write_queue = None
+player_writer = None
+pending_player_writes = {}
+pending_player_lock = threading.Lock()
 download_task = None
+download_task_stop = None
+# 启动任务和 !!ndpr reload 都会重启定时任务, 加锁保证同一时间只有一个下载循环
+download_task_lock = threading.RLock()
+http_session = None
+pending_kicks = 0
+pending_kicks_lock = threading.Lock()
+kicks_total = 0
+kicks_reported = 0
+stage_stats = {}
+stage_stats_lock = threading.Lock()
+kick_reporter = None
+kick_reporter_stop = None
+download_flight = None
+download_flight_lock = threading.Lock()
+plugin_stopping = threading.Event()
+startup_complete = threading.Event()
+deferred_checks = []
+deferred_checks_lock = threading.Lock()
+startup_timings = {}
+ban_index = None
+ban_bloom = None
+bloom_stats = {'negative': 0, 'maybe': 0, 'false_positive': 0}
+bloom_stats_lock = threading.Lock()
+ban_db_version = 0
+verdict_cache = OrderedDict()
+verdict_cache_lock = threading.Lock()
+verdict_cache_generation = 0
+verdict_cache_stats = {'hit': 0, 'miss': 0}
+ban_db_conn = None
+ban_db_conn_key = None
+ban_db_conn_lock = threading.Lock()
+log_tailer = None
+custom_log_matcher = None
+recent_identities = OrderedDict()
+recent_identities_lock = threading.Lock()
+checked_logins = {}
+join_queue = None
+join_batcher = None
 version = "1.4"
 
+BAN_TABLES = ('online', 'offline')
+BAN_INDEX_FIELDS = ('mcuuid', 'player', 'ip', 'ipv6')
+BAN_REQUIRED_COLUMNS = BAN_INDEX_FIELDS + ('ban_reason', 'ban_time')
+# ip / ipv6 字段除单个地址外还可以填写网段: CIDR (10.0.0.0/24) 或地址区间 (10.0.0.1-10.0.0.9)
+BAN_RANGE_FIELDS = ('ip', 'ipv6')
+BAN_DB_MMAP_SIZE = 64 * 1024 * 1024
+BAN_DB_CACHED_STATEMENTS = 64
+# 固定的 SQL 文本, 让每个连接的语句缓存可以直接复用已编译的语句
+# 加入检查的匹配顺序: online 表先比对 UUID, 两张表都依次比对玩家名 / IP / IPv6
+BAN_MATCH_ORDER = tuple(
+    (table, field) for table in BAN_TABLES for field in BAN_INDEX_FIELDS
+    if field != 'mcuuid' or table == 'online'
+)
+BAN_MATCH_PARAMS = {'mcuuid': 'uuid', 'player': 'player', 'ip': 'ip', 'ipv6': 'ipv6'}
+# 一条语句按顺序短路判断, 每个 EXISTS 都只是一次索引查找; 返回 "表.字段" 或 NULL
+BAN_MATCH_SQL = 'SELECT CASE {} END'.format(' '.join(
+    f"WHEN EXISTS(SELECT 1 FROM {table} WHERE {field} = :{BAN_MATCH_PARAMS[field]}) THEN '{table}.{field}'"
+    for table, field in BAN_MATCH_ORDER
+))
+BLOOM_MIN_BITS = 1024
+# 位数组远大于容量时(空列表或手动指定了很大的 bloom_filter_size), 按最优公式算出的哈希个数会达到上千个
+BLOOM_MAX_HASHES = 16
+# 增量同步的改动先记在覆盖层中, 超过该比例后重新打包
+INDEX_OVERLAY_RATIO = 0.1
+INDEX_OVERLAY_MIN = 1024
+IPV4_MAPPED_PREFIX = bytes(10) + b'\xff\xff'
+BAN_DB_INDEXES = {
+    f'idx_{table}_{field}': f'CREATE INDEX IF NOT EXISTS idx_{table}_{field} ON {table} ({field})'
+    for table in BAN_TABLES for field in BAN_INDEX_FIELDS
+}
+BAN_DETAIL_SQL = {
+    (table, field): f'SELECT player, ban_reason, ban_time, ip FROM {table} WHERE {field} = ? LIMIT 1'
+    for table in BAN_TABLES for field in BAN_INDEX_FIELDS
+}
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_JITTER_RATIO = 0.1
+DOWNLOAD_RETRY_BASE = 30
+DOWNLOAD_RETRY_MAX = 3600
+KICK_REPORT_INTERVAL = 60
+# 每个阶段保留最近的耗时样本计算分位数; 分桶边界(秒)用于导出 Prometheus 直方图
+STAGE_SAMPLE_WINDOW = 1024
+STAGE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+HTTP_POOL_SIZE = 8
+# (连接超时, 读取超时), 单位秒
+HTTP_TIMEOUTS = {
+    'uuid': (5, 10),
+    'download': (5, 30),
+    'download_file': (10, 60),
+    'download_done': (5, 10),
+    'delta': (5, 30),
+    'ban': (5, 10),
+    'stats': (3, 5),
+    'update': (5, 30),
+}
+DOWNLOAD_PROGRESS_INTERVAL = 2
+
+LOG_TIME_PATTERN = re.compile(r'\[(\d{2}:\d{2}:\d{2})\]')
+# 身份相关的行必须与原版服务器输出整行匹配, 防止玩家在聊天中伪造登录行
+LOG_UUID_LINE_PATTERN = re.compile(r'^UUID of player (\w+) is ([a-fA-F0-9-]{36})$')
+LOG_LOGIN_PATTERN = re.compile(r'^(\w+)\[/([0-9a-fA-F.:]+):\d+\] logged in with entity id \d+')
+LOG_JOIN_PATTERN = re.compile(r'^(\w+) joined the game$')
+# 自定义模式下玩家名带有头衔等装饰, 先取出整个名称部分再交给 logger_format 解析
+LOG_CUSTOM_UUID_LINE_PATTERN = re.compile(r'^UUID of player (\S+) is ([a-fA-F0-9-]{36})$')
+LOG_CUSTOM_LOGIN_PATTERN = re.compile(r'^(\S+?)\[/([0-9a-fA-F.:]+):\d+\] logged in with entity id \d+')
+LOG_CUSTOM_JOIN_PATTERN = re.compile(r'^(\S+) joined the game$')
+# 日志文件中只信任服务器主线程和登录验证线程输出的行
+LOG_SERVER_PREFIX_PATTERN = re.compile(r'^\[\d{2}:\d{2}:\d{2}\] \[(?:Server thread|User Authenticator #\d+)/INFO\]: ')
+LOGGER_FORMAT_PLACEHOLDERS = {
+    '%s%': r' +',
+    '%name%': r'(?P<name>\w+)',
+}
+# %n% 的正则取决于其后的分隔符, 由 compile_logger_name_format 生成; %message% 只用来确定玩家名部分在哪里结束
+LOGGER_FORMAT_TOKEN_PATTERN = re.compile('|'.join(re.escape(key) for key in ('%n%', '%message%', *LOGGER_FORMAT_PLACEHOLDERS)))
+LOG_READ_CHUNK_SIZE = 64 * 1024
+LOG_TAILER_BOOTSTRAP_BYTES = 1024 * 1024
+RECENT_IDENTITY_TTL = 300
+RECENT_IDENTITY_LIMIT = 1024
+LOGIN_CHECK_TTL = 60
+# 加入事件的合并窗口(秒)和单批上限; 批量 IN 查询每次最多绑定的参数个数
+JOIN_BATCH_WINDOW = 0.2
+JOIN_BATCH_MAX = 100
+SQLITE_IN_BATCH = 500
+PLAYER_WRITE_QUEUE_SIZE = 4096
+PLAYER_FLUSH_BATCH = 256
+PLAYER_FLUSH_INTERVAL = 2
+
+
+class StageHistogram:
+    # 累计的分桶计数供 Prometheus 使用, 最近若干次的样本用于计算分位数
+    def __init__(self):
+        self.buckets = [0] * len(STAGE_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=STAGE_SAMPLE_WINDOW)
+
+    def observe(self, seconds: float):
+        bucket = bisect_left(STAGE_BUCKETS, seconds)
+        if bucket < len(self.buckets):
+            self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def summary(self) -> Dict[str, float]:
+        samples = sorted(self.recent)
+        return {
+            'count': self.count,
+            'p50': samples[len(samples) // 2],
+            'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+            'max': samples[-1],
+        }
+
+
+@contextmanager
+def timed_stage(stage: str):
+    # 既可用作 with 语句也可用作装饰器
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with stage_stats_lock:
+            histogram = stage_stats.get(stage)
+            if histogram is None:
+                histogram = stage_stats[stage] = StageHistogram()
+            histogram.observe(elapsed)
+
+
+def get_stage_stats() -> Dict[str, Dict[str, float]]:
+    with stage_stats_lock:
+        return {stage: stage_stats[stage].summary() for stage in sorted(stage_stats)}
+
+
+def format_prometheus_metrics() -> str:
+    lines = [
+        '# HELP ndpr_stage_duration_seconds Duration of NDPR plugin stages.',
+        '# TYPE ndpr_stage_duration_seconds histogram',
+    ]
+    with stage_stats_lock:
+        for stage in sorted(stage_stats):
+            histogram = stage_stats[stage]
+            cumulative = 0
+            for bound, count in zip(STAGE_BUCKETS, histogram.buckets):
+                cumulative += count
+                lines.append(f'ndpr_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'ndpr_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'ndpr_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.total}')
+            lines.append(f'ndpr_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+    with bloom_stats_lock:
+        bloom = dict(bloom_stats)
+    lines.append('# HELP ndpr_bloom_checks_total Bloom filter results for join checks.')
+    lines.append('# TYPE ndpr_bloom_checks_total counter')
+    for result, count in bloom.items():
+        lines.append(f'ndpr_bloom_checks_total{{result="{result}"}} {count}')
+
+    with verdict_cache_lock:
+        cache = (verdict_cache_stats['hit'], verdict_cache_stats['miss'], len(verdict_cache))
+    lines.append('# HELP ndpr_verdict_cache_lookups_total Verdict cache lookups for join checks.')
+    lines.append('# TYPE ndpr_verdict_cache_lookups_total counter')
+    lines.append(f'ndpr_verdict_cache_lookups_total{{result="hit"}} {cache[0]}')
+    lines.append(f'ndpr_verdict_cache_lookups_total{{result="miss"}} {cache[1]}')
+    lines.append('# TYPE ndpr_verdict_cache_entries gauge')
+    lines.append(f'ndpr_verdict_cache_entries {cache[2]}')
+
+    with pending_kicks_lock:
+        kicks = (kicks_total, kicks_reported, pending_kicks)
+    lines.append('# HELP ndpr_kicks_total Banned players kicked since the plugin was loaded.')
+    lines.append('# TYPE ndpr_kicks_total counter')
+    lines.append(f'ndpr_kicks_total {kicks[0]}')
+    lines.append('# TYPE ndpr_kicks_reported_total counter')
+    lines.append(f'ndpr_kicks_reported_total {kicks[1]}')
+    lines.append('# TYPE ndpr_kicks_pending gauge')
+    lines.append(f'ndpr_kicks_pending {kicks[2]}')
+
+    index = ban_index
+    if index is not None:
+        lines.append('# HELP ndpr_ban_records Ban records per table in the published database.')
+        lines.append('# TYPE ndpr_ban_records gauge')
+        for table in BAN_TABLES:
+            lines.append(f'ndpr_ban_records{{table="{table}"}} {len(index[table]["player"])}')
+
+    timings = dict(startup_timings)
+    lines.append('# HELP ndpr_startup_milliseconds Time spent in each startup phase.')
+    lines.append('# TYPE ndpr_startup_milliseconds gauge')
+    for phase in ('load', 'index', 'ready'):
+        if f'{phase}_ms' in timings:
+            lines.append(f'ndpr_startup_milliseconds{{phase="{phase}"}} {timings[f"{phase}_ms"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus_metrics(server: PluginServerInterface):
+    filename = config.get('prometheus_file') if config else None
+    if not filename:
+        return
+    path = os.path.join(data_dir, filename)
+    try:
+        # 先写临时文件再替换, 采集端不会读到写了一半的文件
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(format_prometheus_metrics())
+        os.replace(tmp_path, path)
+    except Exception as e:
+        server.logger.warning(f'写出 Prometheus 指标失败: {e}')
+
 
 def on_load(server: PluginServerInterface, prev_module):
+    load_start = time.perf_counter()
     try:
-        global config, config_path, data_dir, ban_db_path, player_info_path
+        global config, config_path, data_dir, ban_db_path, ban_db_meta_path, player_info_path, player_db_path, \
+            kick_stats_path
         config_path = os.path.join(server.get_data_folder(), 'config.toml')
 
         config_dir = os.path.dirname(config_path)
         data_dir = os.path.join(config_dir, 'data')
         ban_db_path = os.path.join(data_dir, 'ban_database.db')
+        ban_db_meta_path = os.path.join(data_dir, 'ban_database.json')
         player_info_path = os.path.join(data_dir, 'player_info.json')
+        player_db_path = os.path.join(data_dir, 'player_info.db')
+        kick_stats_path = os.path.join(data_dir, 'kick_stats.json')
         os.makedirs(data_dir, exist_ok=True)
+        init_player_store(server)
+        start_player_writer(server)
 
         init_config(server)
+        init_http_session(server)
         setup_logger(server)
         server.logger.info(f'UUID: {config.get("uuid", "未设置")}')
-        if not config.get('uuid'):
-            server.logger.info('正在获取UUID...')
-            obtain_uuid(server)
 
         register_commands(server)
         onlinemode = config.get('onlinemode')
         server.register_help_message('!!ndpr', 'NDPR主命令')
         server.register_event_listener('MCDRPlayerJoinedEvent', on_player_joined)
-        download_ban_database(server)
-        check_plugin_update(server)
-        server.logger.info('NDPR插件已加载')
-    except Exception as e:
-
+        start_log_tailer(server)
+        load_ban_db_meta(server)
+        start_kick_reporter(server)
+        start_join_batcher(server)
+
+        # 网络请求和索引构建放到后台, 加载期间先用本地已有的数据库进行检查
+        load_kind = 'reload' if prev_module is not None else 'cold'
+        run_startup_tasks(server, load_kind)
+        startup_timings['load_kind'] = load_kind
+        startup_timings['load_ms'] = (time.perf_counter() - load_start) * 1000
+        server.logger.info(f'NDPR插件已加载 ({"重载" if load_kind == "reload" else "冷启动"}, 耗时 {startup_timings["load_ms"]:.1f} ms)')
+    except Exception:
+        # 加载失败时回收已经启动的写入线程、日志读取器等, 配置校验本身只负责抛出异常
+        on_unload(server)
         raise
 
 
 def on_unload(server: PluginServerInterface):
-    global download_task
+    plugin_stopping.set()
+    stop_download_task(server)
+    stop_kick_reporter(server)
+    stop_join_batcher(server)
+    if log_tailer is not None:
+        log_tailer.close()
+    stop_player_writer(server)
+    close_player_store()
+    close_http_session()
+    with ban_db_conn_lock:
+        close_ban_db_connection()
     server.logger.info('NDPR插件已卸载')
 
 
+@new_thread('NDPR_Startup')
+def run_startup_tasks(server: PluginServerInterface, load_kind: str):
+    global ban_db_meta
+
+    start = time.perf_counter()
+    try:
+        if os.path.exists(ban_db_path):
+            try:
+                if has_ban_db_indexes(ban_db_path):
+                    refresh_ban_index(server)
+                else:
+                    reindex_ban_database(server)
+            except sqlite3.DatabaseError as e:
+                # 本地文件已损坏(如旧版本写入中途中断): 丢弃版本标记, 接下来重新完整下载
+                server.logger.error(f'本地封禁数据库已损坏, 将重新下载: {e}')
+                ban_db_meta = {}
+        startup_timings['index_ms'] = (time.perf_counter() - start) * 1000
+
+        if not config.get('uuid') and not plugin_stopping.is_set():
+            server.logger.info('正在获取UUID...')
+            obtain_uuid(server)
+        synced = False
+        if not plugin_stopping.is_set():
+            synced = download_ban_database(server)
+        if not plugin_stopping.is_set():
+            start_download_task(server, 0 if synced else 1)
+    finally:
+        startup_complete.set()
+        startup_timings['ready_ms'] = (time.perf_counter() - start) * 1000
+
+    run_deferred_checks(server)
+    if not plugin_stopping.is_set():
+        check_plugin_update(server)
+    server.logger.info(f'NDPR后台启动任务完成 (索引 {startup_timings["index_ms"]:.1f} ms, 就绪 {startup_timings["ready_ms"]:.1f} ms)')
+
+
+def is_ban_check_ready() -> bool:
+    return ban_index is not None or startup_complete.is_set()
+
+
+def defer_check(player: str, player_info: Dict[str, Optional[str]]) -> bool:
+    with deferred_checks_lock:
+        if startup_complete.is_set():
+            return False
+        deferred_checks.append((player, player_info))
+        return True
+
+
+def run_deferred_checks(server: PluginServerInterface):
+    with deferred_checks_lock:
+        pending = list(deferred_checks)
+        deferred_checks.clear()
+    if pending:
+        check_players(server, dict(pending), save=False)
+
+
 def init_config(server: PluginServerInterface):
     global config
 
@@ -130,14 +479,55 @@ logger_format = "<[%n%]%name%>%s%<%message%>"
 #=======================================
 download_interval = 900
 #=======================================
+# 增量同步
+# Delta sync
+# true = 只下载上次同步以来新增/移除的封禁记录, 增量链断开时自动改为完整下载
+# true = Only fetch bans added/removed since the last sync, falls back to a full download when the chain breaks
+#=======================================
+delta_sync = false
+#=======================================
+# HTTP 压缩
+# HTTP compression
+# true = 请求 API 时接受 gzip 压缩响应
+# true = Accept gzip-compressed responses from the API
+#=======================================
+http_gzip = true
+#=======================================
+# 布隆过滤器
+# Bloom filter
+# true = 加入检查先查询布隆过滤器, 确定不在封禁列表中的玩家直接放行
+# true = Check joins against a Bloom filter first, players that are definitely not banned skip the exact lookup
+# bloom_filter_size = 过滤器大小(KB), 0 = 按记录数和误判率自动计算
+# bloom_filter_size = Filter size (KB), 0 = derive from the record count and false positive rate
+#=======================================
+bloom_filter = true
+bloom_filter_size = 0
+bloom_false_positive_rate = 0.01
+#=======================================
+# Prometheus 指标文件
+# Prometheus metrics file
+# 填写文件名后定期在 data 目录写出文本格式的指标, 供 node_exporter 的 textfile collector 读取, 留空则不写出
+# Periodically write text-format metrics to this file in the data folder for node_exporter's textfile collector, empty = disabled
+#=======================================
+prometheus_file = ""
+#=======================================
+# 判定缓存
+# Verdict cache
+# 缓存 (玩家名, UUID, IP, IPv6) 的检查结果, 同一玩家重复进服时直接复用; 封禁数据库更新后自动失效
+# Cache the verdict for each (name, UUID, IP, IPv6), reused on reconnects and dropped when the ban database changes
+# verdict_cache_size = 最多缓存条数, 0 = 关闭 / Max entries, 0 = disabled
+# verdict_cache_ttl = 缓存有效期(秒) / Entry lifetime (seconds)
+#=======================================
+verdict_cache_size = 4096
+verdict_cache_ttl = 600
+#=======================================
 
 """
         with open(config_path, 'w', encoding='utf-8') as f:
             f.write(config_content)
         with open(config_path, 'r', encoding='utf-8') as f:
             config = toml.load(f)
-        server.logger.info('正在尝试获取UUID...')
-        obtain_uuid(server)
+        server.logger.info('UUID将在插件加载完成后自动获取')
     else:
         try:
             with open(config_path, 'r', encoding='utf-8') as f:
@@ -154,7 +544,6 @@ download_interval = 900
             server.logger.error('请在ndpr配置文件里填写服务器类型(正版或离线),否则插件不会加载')
             server.logger.error('请在ndpr配置文件里填写服务器类型(正版或离线),否则插件不会加载')
             server.logger.error('请在ndpr配置文件里填写服务器类型(正版或离线),否则插件不会加载')
-            on_unload(server)
             raise Exception('插件卸载')
 
         if isinstance(onlinemode, str):
@@ -209,21 +598,82 @@ def validate_config(server: PluginServerInterface):
     if not isinstance(download_interval, int) or download_interval <= 0:
         errors.append('配置文件错误:字段download_interval')
 
+    if not isinstance(config.get('delta_sync', False), bool):
+        errors.append('配置文件错误:字段delta_sync')
+
+    if not isinstance(config.get('http_gzip', True), bool):
+        errors.append('配置文件错误:字段http_gzip')
+
+    if not isinstance(config.get('bloom_filter', True), bool):
+        errors.append('配置文件错误:字段bloom_filter')
+
+    bloom_filter_size = config.get('bloom_filter_size', 0)
+    if not isinstance(bloom_filter_size, int) or isinstance(bloom_filter_size, bool) or bloom_filter_size < 0:
+        errors.append('配置文件错误:字段bloom_filter_size')
+
+    bloom_false_positive_rate = config.get('bloom_false_positive_rate', 0.01)
+    if not isinstance(bloom_false_positive_rate, (int, float)) or isinstance(bloom_false_positive_rate, bool) or \
+            not 0 < bloom_false_positive_rate < 1:
+        errors.append('配置文件错误:字段bloom_false_positive_rate')
+
+    if not isinstance(config.get('prometheus_file', ''), str):
+        errors.append('配置文件错误:字段prometheus_file')
+
+    for key, default in (('verdict_cache_size', 4096), ('verdict_cache_ttl', 600)):
+        value = config.get(key, default)
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            errors.append(f'配置文件错误:字段{key}')
+
     if errors:
         for error in errors:
             server.logger.error(f'  - {error}')
         server.logger.error('请检查 config.toml 配置文件')
-        on_unload(server)
         raise Exception('配置文件格式错误')
 
 def setup_logger(server: PluginServerInterface):
-    global config
+    global config, custom_log_matcher
 
     logger_mode = config.get('logger_mode', 'default')
+    custom_log_matcher = None
 
     if logger_mode == 'custom':
-        custom_format = config.get('logger_format', '<[%ip%]%name%>]%s%>%s%<%message%>')
+        custom_format = config.get('logger_format', '<[%n%]%name%>%s%<%message%>')
         server.logger.info(f'使用自定义日志格式: {custom_format}')
+        try:
+            custom_log_matcher = compile_logger_name_format(custom_format)
+        except re.error as e:
+            server.logger.error(f'自定义日志格式无效, 将使用默认模式: {e}')
+            return
+        if custom_log_matcher is None:
+            server.logger.error('自定义日志格式缺少 %name%, 将使用默认模式')
+
+
+def compile_logger_name_format(logger_format: str) -> Optional[re.Pattern]:
+    # logger_format 描述的是聊天格式, %message% 由玩家输入, 不可信
+    # 只截取开头到 %name% 及其后紧跟的非空白文本(如 "<[%n%]%name%>"), 用于读取服务器登录行和 UUID 行中的玩家名
+    position = logger_format.find('%name%')
+    if position < 0:
+        return None
+    end = position + len('%name%')
+    next_token = LOGGER_FORMAT_TOKEN_PATTERN.search(logger_format, end)
+    suffix = logger_format[end:next_token.start() if next_token else len(logger_format)]
+    segment = logger_format[:end] + re.split(r'\s', suffix, maxsplit=1)[0]
+
+    parts = []
+    position = 0
+    for token in LOGGER_FORMAT_TOKEN_PATTERN.finditer(segment):
+        parts.append(re.escape(segment[position:token.start()]))
+        following = segment[token.end():token.end() + 1]
+        if token.group() == '%n%' and following and following != '%':
+            # %n% 不能越过其后的分隔符, 否则聊天内容可以伪装成另一个玩家名
+            parts.append(f'[^\\s{re.escape(following)}]*')
+        elif token.group() == '%n%':
+            parts.append(r'\S*?')
+        else:
+            parts.append(LOGGER_FORMAT_PLACEHOLDERS[token.group()])
+        position = token.end()
+    parts.append(re.escape(segment[position:]))
+    return re.compile(''.join(parts) + '$')
 
 
 def check_config_completeness(server: PluginServerInterface):
@@ -268,6 +718,34 @@ def check_config_completeness(server: PluginServerInterface):
 
 
 
+def init_http_session(server: PluginServerInterface):
+    global http_session
+
+    # 插件内所有 HTTP 请求共用一个带连接池的会话, 复用 TCP/TLS 连接
+    close_http_session()
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = f'NDPR-MCDR/{version}'
+    if not config.get('http_gzip', True):
+        session.headers['Accept-Encoding'] = 'identity'
+    http_session = session
+
+
+def close_http_session():
+    global http_session
+
+    if http_session is not None:
+        http_session.close()
+    http_session = None
+
+
+def http():
+    # 会话尚未创建(首次生成配置文件时获取 UUID)或已关闭时退回到 requests 模块函数
+    return http_session if http_session is not None else requests
+
+
 def obtain_uuid(server: PluginServerInterface):
     global config
 
@@ -279,7 +757,7 @@ def obtain_uuid(server: PluginServerInterface):
 
     try:
         url = f"{config['api_url']}/uuid/getuuid"
-        response = requests.post(url, timeout=10)
+        response = http().post(url, timeout=HTTP_TIMEOUTS['uuid'])
         server.logger.info(f'API响应状态: HTTP {response.status_code}')
         if response.status_code == 200:
             data = response.json()
@@ -305,7 +783,63 @@ def obtain_uuid(server: PluginServerInterface):
         server.logger.error(f'获取UUID失败: {e}')
 
 
-def download_ban_database(server: PluginServerInterface, src=None):
+class DownloadFlight:
+    """
+    正在进行的一次封禁数据库更新, 同时发起的其他更新请求会附加到这里等待结果
+    作为 src 传给实际下载流程, 消息会转发给所有已附加的命令来源
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = False
+        self.sources = []
+        self.message_count = 0
+
+    def attach(self, src):
+        self.sources.append((src, self.message_count))
+
+    def reply(self, msg):
+        with download_flight_lock:
+            self.message_count += 1
+            sources = [src for src, _ in self.sources]
+        for src in sources:
+            src.reply(msg)
+
+
+def download_ban_database(server: PluginServerInterface, src=None) -> bool:
+    global download_flight
+
+    with download_flight_lock:
+        flight = download_flight
+        is_leader = flight is None
+        if is_leader:
+            flight = download_flight = DownloadFlight()
+        if src is not None:
+            flight.attach(src)
+
+    if not is_leader:
+        # 已有更新在进行, 不再发起第二次传输, 等待其结果
+        if src is not None:
+            src.reply('§e已有封禁数据库更新正在进行, 完成后将通知结果')
+        flight.done.wait()
+        return flight.result
+
+    try:
+        flight.result = run_ban_database_download(server, flight)
+    finally:
+        with download_flight_lock:
+            download_flight = None
+            # 在最终结果消息之后才附加的来源没有收到任何消息, 单独通知结果
+            missed = [src for src, seen in flight.sources if seen == flight.message_count]
+        flight.done.set()
+        summary = '§a封禁数据库更新完成' if flight.result else '§c封禁数据库更新失败'
+        for missed_src in missed:
+            missed_src.reply(summary)
+    return flight.result
+
+
+@timed_stage('download.total')
+def run_ban_database_download(server: PluginServerInterface, src: DownloadFlight) -> bool:
     global config
 
     if not config.get('token'):
@@ -318,59 +852,95 @@ def download_ban_database(server: PluginServerInterface, src=None):
         server.logger.warning(msg)
         if src:
             src.reply(f'§c{msg}')
-        return
+        return False
 
     if not config.get('api_url'):
         msg = 'API未配置,无法下载数据库'
         server.logger.error(msg)
         if src:
             src.reply(f'§c{msg}')
-        return
+        return False
 
     try:
+        # 本地已有数据库时带上上次的版本标记, 服务端无变化则跳过下载/重建索引
+        meta = ban_db_meta if os.path.exists(ban_db_path) else {}
+        if config.get('delta_sync', False) and meta.get('version') and sync_ban_delta(server, meta, src):
+            return True
+
         params = {'token': config['token']}
-        response = requests.get(f"{config['api_url']}/bans/download", params=params, timeout=30)
+        if meta.get('version'):
+            params['version'] = meta['version']
+        response = http().get(
+            f"{config['api_url']}/bans/download",
+            params=params,
+            headers=conditional_headers(meta.get('api_etag'), meta.get('api_last_modified')),
+            timeout=HTTP_TIMEOUTS['download']
+        )
+
+        if response.status_code == 304:
+            report_ban_database_unchanged(server, src)
+            return True
 
         if response.status_code != 200:
             error_msg = f'API响应错误 HTTP{response.status_code} 响应内容: {response.text}'
             server.logger.error(error_msg)
             if src:
                 src.reply(f'§c{error_msg}')
-            return
+            return False
 
         data = response.json()
         download_url = data.get('url')
+        remote_version = data.get('version') or data.get('sha256')
+
+        if data.get('unchanged') or (remote_version and remote_version == meta.get('version')):
+            report_ban_database_unchanged(server, src)
+            return True
 
         if not download_url:
             error_msg = 'API响应错误'
             server.logger.error(error_msg)
             if src:
                 src.reply(f'§c{error_msg}')
-            return
-
-        download_response = requests.get(download_url, timeout=60)
-
-        if download_response.status_code != 200:
-            error_msg = f'API响应错误 HTTP{download_response.status_code} Download Error'
-            server.logger.error(error_msg)
-            if src:
-                src.reply(f'§c{error_msg}')
-            return
-
-        with open(ban_db_path, 'wb') as f:
-            f.write(download_response.content)
+            return False
 
-        conn = sqlite3.connect(ban_db_path)
-        cursor = conn.cursor()
+        # 先流式写入 data_dir 下的临时文件, 校验通过后再原子替换, 校验失败则继续使用旧数据库
+        fd, tmp_path = tempfile.mkstemp(prefix='ban_database.', suffix='.tmp', dir=data_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                result = stream_download(server, download_url, f, src,
+                                         conditional_headers(meta.get('etag'), meta.get('last_modified')))
+            if result is None:
+                return False
+            if result.get('not_modified'):
+                report_ban_database_unchanged(server, src)
+                return True
+
+            digest = result['sha256']
+            expected_digest = data.get('sha256')
+            if expected_digest and digest != expected_digest.lower():
+                error_msg = f'数据库校验失败: SHA-256 不匹配 (期望 {expected_digest}, 实际 {digest})'
+                server.logger.error(error_msg)
+                if src:
+                    src.reply(f'§c{error_msg}')
+                return False
+
+            counts = publish_ban_database(server, tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        save_ban_db_meta(server, {
+            'version': remote_version or digest,
+            'counts': counts,
+            'sha256': digest,
+            'etag': result.get('etag'),
+            'last_modified': result.get('last_modified'),
+            'api_etag': response.headers.get('ETag'),
+            'api_last_modified': response.headers.get('Last-Modified'),
+        })
 
         is_online = config.get('onlinemode', False)
-        if is_online:
-            cursor.execute("SELECT COUNT(*) FROM online")
-        else:
-            cursor.execute("SELECT COUNT(*) FROM offline")
-
-        count = cursor.fetchone()[0]
-        conn.close()
+        count = counts['online' if is_online else 'offline']
 
         table_name = 'online' if is_online else 'offline'
         success_msg = f'§a封禁数据库下载成功！'
@@ -382,21 +952,865 @@ def download_ban_database(server: PluginServerInterface, src=None):
             src.reply(detail_msg)
 
         try:
-            done_response = requests.post(
+            done_response = http().post(
                 f"{config['api_url']}/bans/download/done",
                 json={'token': config['token']},
-                timeout=10
+                timeout=HTTP_TIMEOUTS['download_done']
             )
             if done_response.status_code == 200:
                 server.logger.info(f'数据库已更新')
+            else:
+                server.logger.warning(f'API相应错误 HTTP{done_response.status_code}')
         except Exception as e:
-            server.logger.warning(f'API相应错误 HTTP{done_response.status_code} {e}')
+            server.logger.warning(f'API相应错误 {e}')
+        return True
 
     except Exception as e:
         error_msg = f'数据库更新失败: {e}'
         server.logger.error(error_msg)
         if src:
             src.reply(f'§c{error_msg}')
+        return False
+
+
+@timed_stage('download.delta')
+def sync_ban_delta(server: PluginServerInterface, meta: dict, src=None) -> bool:
+    # 返回 True 表示已通过增量同步完成(或无变化); False 表示需要退回完整下载
+    try:
+        response = http().get(
+            f"{config['api_url']}/bans/delta",
+            params={'token': config['token'], 'since': meta['version']},
+            timeout=HTTP_TIMEOUTS['delta']
+        )
+        if response.status_code == 304:
+            report_ban_database_unchanged(server, src)
+            return True
+        if response.status_code != 200:
+            server.logger.info(f'增量同步不可用 (HTTP{response.status_code}), 改为完整下载')
+            return False
+
+        delta = response.json()
+        if delta.get('unchanged') or delta.get('version') == meta['version']:
+            report_ban_database_unchanged(server, src)
+            return True
+        if delta.get('base') != meta['version'] or not delta.get('version'):
+            server.logger.info(f'增量链已断开 (本地 {meta["version"]}, 增量基于 {delta.get("base")}), 改为完整下载')
+            return False
+
+        counts = apply_ban_delta(server, delta, meta.get('counts'))
+    except Exception as e:
+        server.logger.warning(f'增量同步失败, 改为完整下载: {e}')
+        return False
+
+    save_ban_db_meta(server, {'version': delta['version'], 'counts': counts})
+    count = counts['online' if config.get('onlinemode', False) else 'offline']
+    detail_msg = f'§7数据库已增量更新至版本 {delta["version"]}，共 {count} 条记录'
+    server.logger.info(detail_msg)
+    if src:
+        src.reply('§a封禁数据库更新成功！')
+        src.reply(detail_msg)
+    return True
+
+
+def validate_ban_delta(delta: dict):
+    # 写入前先检查整个增量, 任何一行不合法都放弃增量同步, 本地数据库保持不变
+    for table in BAN_TABLES:
+        changes = delta.get(table) or {}
+        if not isinstance(changes, dict):
+            raise ValueError(f'增量数据格式错误: {table}')
+        for kind in ('removed', 'added'):
+            rows = changes.get(kind) or []
+            if not isinstance(rows, list):
+                raise ValueError(f'增量数据格式错误: {table}.{kind}')
+            for row in rows:
+                if not isinstance(row, dict):
+                    raise ValueError(f'增量数据格式错误: {table}.{kind} 包含非对象记录')
+                if kind == 'removed' and row.get('id') is not None:
+                    if not isinstance(row['id'], int) or isinstance(row['id'], bool):
+                        raise ValueError(f'增量数据格式错误: {table}.removed 的 id 无效')
+                    continue
+                columns = BAN_REQUIRED_COLUMNS if kind == 'added' else BAN_INDEX_FIELDS
+                if any(row.get(column) is not None and not isinstance(row[column], str) for column in columns):
+                    raise ValueError(f'增量数据格式错误: {table}.{kind} 字段类型无效')
+                if not any(row.get(field) for field in BAN_INDEX_FIELDS):
+                    raise ValueError(f'增量数据格式错误: {table}.{kind} 记录缺少玩家名、UUID 和 IP')
+
+
+def apply_ban_delta(server: PluginServerInterface, delta: dict,
+                    previous_counts: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    global ban_index, ban_db_version
+
+    validate_ban_delta(delta)
+    columns = ', '.join(BAN_REQUIRED_COLUMNS)
+    placeholders = ', '.join('?' for _ in BAN_REQUIRED_COLUMNS)
+    fields = ', '.join(BAN_INDEX_FIELDS)
+    # NULL 与空字符串视为相同, 只删除与整条记录完全一致的一行
+    match_condition = ' AND '.join(f"IFNULL({field}, '') = ?" for field in BAN_INDEX_FIELDS)
+    removed = {table: [] for table in BAN_TABLES}
+    added = {table: [] for table in BAN_TABLES}
+
+    conn = sqlite3.connect(ban_db_path)
+    try:
+        # 所有变更在同一个事务内提交, 失败则整体回滚
+        with conn:
+            for table in BAN_TABLES:
+                changes = delta.get(table) or {}
+                for row in changes.get('removed') or []:
+                    if row.get('id') is not None:
+                        found = conn.execute(f'SELECT rowid, {fields} FROM {table} WHERE id = ?',
+                                             (row['id'],)).fetchone()
+                    else:
+                        found = conn.execute(f'SELECT rowid, {fields} FROM {table} WHERE {match_condition} LIMIT 1',
+                                             tuple(row.get(field) or '' for field in BAN_INDEX_FIELDS)).fetchone()
+                    if found is None:
+                        # 本地与服务端不一致, 回滚并改为完整下载
+                        raise ValueError(f'增量中要移除的记录在本地不存在 ({table}: {row})')
+                    conn.execute(f'DELETE FROM {table} WHERE rowid = ?', (found[0],))
+                    removed[table].append(tuple(found[1:]))
+                for row in changes.get('added') or []:
+                    values = tuple(row.get(column) for column in BAN_REQUIRED_COLUMNS)
+                    conn.execute(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', values)
+                    added[table].append(values[:len(BAN_INDEX_FIELDS)])
+
+        if previous_counts:
+            counts = {table: previous_counts[table] - len(removed[table]) + len(added[table]) for table in BAN_TABLES}
+        else:
+            counts = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in BAN_TABLES}
+    finally:
+        conn.close()
+
+    if ban_index is not None:
+        new_index = apply_delta_to_index(ban_index, removed, added)
+        update_ban_bloom(server, added)
+        ban_index = new_index
+    else:
+        refresh_ban_index(server)
+    ban_db_version += 1
+    clear_verdict_cache()
+    changed = sum(len(rows) for rows in removed.values()) + sum(len(rows) for rows in added.values())
+    server.logger.info(f'已应用增量更新 (版本 {ban_db_version}, 变更 {changed} 行)')
+    return counts
+
+
+def conditional_headers(etag: Optional[str], last_modified: Optional[str]) -> Dict[str, str]:
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+def load_ban_db_meta(server: PluginServerInterface):
+    global ban_db_meta
+
+    ban_db_meta = {}
+    if not os.path.exists(ban_db_meta_path):
+        return
+    try:
+        with open(ban_db_meta_path, 'r', encoding='utf-8') as f:
+            ban_db_meta = json.load(f)
+    except Exception as e:
+        server.logger.warning(f'读取封禁数据库版本信息失败: {e}')
+
+
+def save_ban_db_meta(server: PluginServerInterface, meta: Dict[str, Optional[str]]):
+    global ban_db_meta
+
+    ban_db_meta = meta
+    try:
+        tmp_path = ban_db_meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, ban_db_meta_path)
+    except Exception as e:
+        server.logger.warning(f'保存封禁数据库版本信息失败: {e}')
+
+
+def report_ban_database_unchanged(server: PluginServerInterface, src=None):
+    msg = f'§a封禁数据库已是最新 (版本 {ban_db_meta.get("version")})'
+    server.logger.info(msg)
+    if src:
+        src.reply(msg)
+
+
+@timed_stage('download.transfer')
+def stream_download(server: PluginServerInterface, url: str, f, src=None,
+                    headers: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Optional[str]]]:
+    # 按固定大小分块写入文件并同时计算 SHA-256, 内存占用与数据库大小无关
+    with http().get(url, headers=headers, stream=True, timeout=HTTP_TIMEOUTS['download_file']) as response:
+        if response.status_code == 304:
+            return {'not_modified': True}
+        if response.status_code != 200:
+            error_msg = f'API响应错误 HTTP{response.status_code} Download Error'
+            server.logger.error(error_msg)
+            if src:
+                src.reply(f'§c{error_msg}')
+            return None
+
+        total = int(response.headers.get('Content-Length') or 0)
+        digest = hashlib.sha256()
+        received = 0
+        last_report = time.monotonic()
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            f.write(chunk)
+            digest.update(chunk)
+            received += len(chunk)
+            if src and time.monotonic() - last_report >= DOWNLOAD_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                if total:
+                    src.reply(f'§7已下载 {received / 1024 / 1024:.1f} MB / {total / 1024 / 1024:.1f} MB ({received * 100 // total}%)')
+                else:
+                    src.reply(f'§7已下载 {received / 1024 / 1024:.1f} MB')
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+    server.logger.info(f'封禁数据库下载完成 ({received} 字节)')
+    return {'sha256': digest.hexdigest(), 'etag': etag, 'last_modified': last_modified}
+
+
+def build_ban_index(db_path: str) -> Dict[str, dict]:
+    # 每个字段保留重复值, 增量同步移除记录时据此判断该值是否仍被封禁
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        index = {}
+        for table in BAN_TABLES:
+            keys = {field: [] for field in BAN_INDEX_FIELDS}
+            cursor.execute(f"SELECT mcuuid, player, ip, ipv6 FROM {table}")
+            for row in cursor:
+                for field, value in zip(BAN_INDEX_FIELDS, row):
+                    if value:
+                        keys[field].append(normalize_ban_key(field, value))
+            fields = {field: PackedKeySet(keys.pop(field)) for field in BAN_INDEX_FIELDS}
+            fields['ranges'] = build_range_tries(fields)
+            index[table] = fields
+        return index
+    finally:
+        conn.close()
+
+
+def normalize_ban_key(field: str, value) -> object:
+    # UUID 和 IPv6 转为 16 字节, IPv4 转为 32 位整数; 无法解析的值(含网段)保留原字符串
+    value = str(value)
+    if field == 'mcuuid':
+        # 去掉连字符后按十六进制解析, 构建百万行索引时比 uuid.UUID 快得多
+        try:
+            key = bytes.fromhex(value.replace('-', ''))
+        except ValueError:
+            return value
+        return key if len(key) == 16 else value
+    if field in BAN_RANGE_FIELDS:
+        if ':' not in value:
+            try:
+                return int.from_bytes(socket.inet_pton(socket.AF_INET, value), 'big')
+            except OSError:
+                return value
+        try:
+            key = socket.inet_pton(socket.AF_INET6, value)
+        except OSError:
+            return value
+        # IPv4 映射地址 (::ffff:a.b.c.d) 按 IPv4 处理
+        return int.from_bytes(key[12:], 'big') if key.startswith(IPV4_MAPPED_PREFIX) else key
+    return value
+
+
+class FixedWidthKeys:
+    # 定长键首尾相接存放在一个 bytes 中, 提供序列接口给 bisect 使用
+    def __init__(self, keys: list, width: int):
+        self.width = width
+        self.data = b''.join(keys)
+
+    def __len__(self) -> int:
+        return len(self.data) // self.width
+
+    def __getitem__(self, i: int) -> bytes:
+        width = self.width
+        return self.data[i * width:(i + 1) * width]
+
+
+class PackedStrings:
+    # 变长字符串以 UTF-8 拼接存放, offsets 记录每个字符串的起始位置
+    def __init__(self, keys: list):
+        self.data = b''.join(keys)
+        self.offsets = array('I', [0])
+        position = 0
+        for key in keys:
+            position += len(key)
+            self.offsets.append(position)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+
+class PackedKeySet:
+    # 一个字段的全部封禁值, 按类型存放在排好序的紧凑缓冲区中用二分查找;
+    # overlay 记录增量同步带来的 键 -> 行数变化, 基础缓冲区本身不可变, 可在新旧索引间共享
+    def __init__(self, keys: list, overlay: Optional[Dict[object, int]] = None):
+        ints, blobs, texts = [], [], []
+        for key in keys:
+            if isinstance(key, int):
+                ints.append(key)
+            elif isinstance(key, bytes):
+                blobs.append(key)
+            else:
+                texts.append(key.encode('utf-8'))
+        ints.sort()
+        blobs.sort()
+        texts.sort()
+        self.ints = array('I', ints)
+        self.blobs = FixedWidthKeys(blobs, 16)
+        self.texts = PackedStrings(texts)
+        self.overlay = overlay or {}
+        self.size = len(keys) + sum(self.overlay.values())
+
+    def base_sequence(self, key) -> tuple:
+        if isinstance(key, int):
+            return self.ints, key
+        if isinstance(key, bytes):
+            return self.blobs, key
+        return self.texts, key.encode('utf-8')
+
+    def base_count(self, key) -> int:
+        seq, k = self.base_sequence(key)
+        return bisect_right(seq, k) - bisect_left(seq, k)
+
+    def __contains__(self, key) -> bool:
+        delta = self.overlay.get(key) if self.overlay else None
+        if delta is not None:
+            return self.base_count(key) + delta > 0
+        seq, k = self.base_sequence(key)
+        i = bisect_left(seq, k)
+        return i < len(seq) and seq[i] == k
+
+    def __len__(self) -> int:
+        return self.size
+
+    def base_keys(self):
+        for i in self.ints:
+            yield i
+        for i in range(len(self.blobs)):
+            yield self.blobs[i]
+        for i in range(len(self.texts)):
+            yield self.texts[i].decode('utf-8')
+
+    def __iter__(self):
+        # 逐个返回仍被封禁的不同键
+        previous = None
+        for key in self.base_keys():
+            if key == previous:
+                continue
+            previous = key
+            if key not in self.overlay or key in self:
+                yield key
+        for key, delta in self.overlay.items():
+            if delta > 0 and self.base_count(key) == 0:
+                yield key
+
+    def with_changes(self, changes: Dict[object, int]) -> 'PackedKeySet':
+        overlay = dict(self.overlay)
+        for key, delta in changes.items():
+            delta += overlay.get(key, 0)
+            if delta:
+                overlay[key] = delta
+            else:
+                overlay.pop(key, None)
+        if len(overlay) <= max(INDEX_OVERLAY_MIN, self.size * INDEX_OVERLAY_RATIO):
+            new = PackedKeySet.__new__(PackedKeySet)
+            new.ints, new.blobs, new.texts = self.ints, self.blobs, self.texts
+            new.overlay = overlay
+            new.size = self.size + sum(changes.values())
+            return new
+        counts = Counter(self.base_keys())
+        counts.update(overlay)
+        return PackedKeySet([key for key, count in counts.items() for _ in range(count)])
+
+
+class BloomFilter:
+    # 位数组 + 双重哈希; 使用进程内的 hash(), 过滤器只存在于内存中, 每次加载都会重建
+    def __init__(self, capacity: int, false_positive_rate: float, size_bytes: int = 0):
+        capacity = max(capacity, 1)
+        if size_bytes > 0:
+            bits = size_bytes * 8
+        else:
+            bits = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        self.size = max(bits, BLOOM_MIN_BITS)
+        optimal = round(self.size / capacity * math.log(2))
+        # 达到目标误判率只需 -log2(p) 个哈希, 再多只会拖慢每次查询和构建
+        self.hash_count = max(1, min(optimal, math.ceil(-math.log2(false_positive_rate)), BLOOM_MAX_HASHES))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, key: str):
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hash_count)]
+
+    def add(self, key: str):
+        bits = self.bits
+        for pos in self.positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        for pos in self.positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def copy(self) -> 'BloomFilter':
+        new = BloomFilter.__new__(BloomFilter)
+        new.size = self.size
+        new.hash_count = self.hash_count
+        new.bits = bytearray(self.bits)
+        new.count = self.count
+        return new
+
+    def expected_false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+
+def bloom_key(field: str, key) -> tuple:
+    # 带上字段名, 避免玩家名与其他字段的值互相命中
+    return field, key
+
+
+def build_ban_bloom(server: PluginServerInterface, index) -> Optional[BloomFilter]:
+    if not config or not config.get('bloom_filter', True):
+        return None
+
+    keys = {
+        bloom_key(field, key)
+        for table, field in BAN_MATCH_ORDER for key in index[table][field]
+    }
+    bloom = BloomFilter(len(keys), config.get('bloom_false_positive_rate', 0.01),
+                        config.get('bloom_filter_size', 0) * 1024)
+    for key in keys:
+        bloom.add(key)
+    server.logger.info(f'布隆过滤器已构建 ({bloom.count} 项, {len(bloom.bits) / 1024:.0f} KB, '
+                       f'{bloom.hash_count} 个哈希, 预计误判率 {bloom.expected_false_positive_rate():.2%})')
+    log_bloom_stats(server)
+    return bloom
+
+
+def update_ban_bloom(server: PluginServerInterface, added: Dict[str, list]):
+    global ban_bloom
+
+    if ban_bloom is None:
+        return
+    # 布隆过滤器不支持删除: 增量更新只加入新增记录, 已解封的值留到下次完整构建时清除
+    new_bloom = ban_bloom.copy()
+    for table, rows in added.items():
+        for row in rows:
+            for field, value in zip(BAN_INDEX_FIELDS, row):
+                if value and (table, field) in BAN_MATCH_ORDER:
+                    new_bloom.add(bloom_key(field, normalize_ban_key(field, value)))
+    ban_bloom = new_bloom
+
+
+def count_bloom_result(result: str):
+    with bloom_stats_lock:
+        bloom_stats[result] += 1
+
+
+def format_bloom_stats() -> Optional[str]:
+    with bloom_stats_lock:
+        stats = dict(bloom_stats)
+    total = stats['negative'] + stats['maybe']
+    if not total:
+        return None
+    return (f'共 {total} 次检查, 直接放行 {stats["negative"]} 次 ({stats["negative"] / total:.1%}), '
+            f'精确检查 {stats["maybe"]} 次, 其中误判 {stats["false_positive"]} 次')
+
+
+def log_bloom_stats(server: PluginServerInterface):
+    summary = format_bloom_stats()
+    if summary:
+        server.logger.info(f'布隆过滤器统计: {summary}')
+
+
+def apply_delta_to_index(index, removed: Dict[str, list], added: Dict[str, list]):
+    # 写时复制: 只替换有变动的字段, 加入检查线程始终看到完整的旧索引或新索引
+    new_index = {table: dict(fields) for table, fields in index.items()}
+    for table in BAN_TABLES:
+        if not removed[table] and not added[table]:
+            continue
+        fields = new_index[table]
+        changes = {field: {} for field in BAN_INDEX_FIELDS}
+        ranges_changed = False
+        for rows, step in ((removed[table], -1), (added[table], 1)):
+            for row in rows:
+                for field, value in zip(BAN_INDEX_FIELDS, row):
+                    if not value:
+                        continue
+                    if field in BAN_RANGE_FIELDS and is_ip_range(value):
+                        ranges_changed = True
+                    key = normalize_ban_key(field, value)
+                    changes[field][key] = changes[field].get(key, 0) + step
+        for field, field_changes in changes.items():
+            if field_changes:
+                fields[field] = fields[field].with_changes(field_changes)
+        if ranges_changed:
+            fields['ranges'] = build_range_tries(fields)
+    return new_index
+
+
+class PrefixTrie:
+    # 按位展开的二叉前缀树, 节点为 [0 分支, 1 分支, 网段]; 查找最多走 32 / 128 层, 与网段数量无关
+    def __init__(self):
+        self.roots = {4: [None, None, None], 6: [None, None, None]}
+        self.count = 0
+
+    def insert(self, network, value: str):
+        node = self.roots[network.version]
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        for i in range(network.prefixlen):
+            bit = (bits >> (width - 1 - i)) & 1
+            child = node[bit]
+            if child is None:
+                child = node[bit] = [None, None, None]
+            node = child
+        if node[2] is None:
+            node[2] = value
+            self.count += 1
+
+    def longest_match(self, address: str) -> Optional[str]:
+        # 返回覆盖该地址的最长前缀网段在数据库中的原始写法
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return None
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        node = self.roots[ip.version]
+        bits = int(ip)
+        width = ip.max_prefixlen
+        found = node[2]
+        for i in range(width):
+            node = node[(bits >> (width - 1 - i)) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                found = node[2]
+        return found
+
+
+def is_ip_range(value: str) -> bool:
+    return '/' in value or '-' in value
+
+
+def parse_ip_range(value: str) -> list:
+    if '/' in value:
+        return [ipaddress.ip_network(value.strip(), strict=False)]
+    start, end = value.split('-', 1)
+    return list(ipaddress.summarize_address_range(ipaddress.ip_address(start.strip()),
+                                                  ipaddress.ip_address(end.strip())))
+
+
+def build_range_tries(fields: Dict[str, PackedKeySet]) -> Dict[str, PrefixTrie]:
+    tries = {}
+    for field in BAN_RANGE_FIELDS:
+        trie = PrefixTrie()
+        for value in fields[field]:
+            if not isinstance(value, str) or not is_ip_range(value):
+                continue
+            try:
+                networks = parse_ip_range(value)
+            except (ValueError, TypeError):
+                # 无法解析的网段只保留精确匹配
+                continue
+            for network in networks:
+                trie.insert(network, value)
+        if trie.count:
+            tries[field] = trie
+    return tries
+
+
+def validate_ban_database(db_path: str) -> Dict[str, int]:
+    conn = sqlite3.connect(db_path)
+    try:
+        result = conn.execute('PRAGMA integrity_check').fetchone()
+        if not result or result[0] != 'ok':
+            raise ValueError(f'数据库完整性检查失败: {result[0] if result else None}')
+
+        counts = {}
+        for table in BAN_TABLES:
+            columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+            if not columns:
+                raise ValueError(f'数据库缺少数据表 {table}')
+            missing = [column for column in BAN_REQUIRED_COLUMNS if column not in columns]
+            if missing:
+                raise ValueError(f'数据表 {table} 缺少字段 {", ".join(missing)}')
+            counts[table] = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+        create_ban_db_indexes(conn)
+        conn.commit()
+        return counts
+    finally:
+        conn.close()
+
+
+def create_ban_db_indexes(conn: sqlite3.Connection):
+    # 加入检查只需判断是否存在, 单列索引即可覆盖查询, 无需回表
+    for sql in BAN_DB_INDEXES.values():
+        conn.execute(sql)
+
+
+def has_ban_db_indexes(db_path: str) -> bool:
+    conn = sqlite3.connect(db_path)
+    try:
+        names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        return all(name in names for name in BAN_DB_INDEXES)
+    finally:
+        conn.close()
+
+
+def reindex_ban_database(server: PluginServerInterface):
+    # 旧版本插件下载的数据库没有索引: 复制一份建立索引后重新发布, 不原地修改正在被读取的文件
+    server.logger.info('本地封禁数据库缺少索引, 正在重建...')
+    fd, tmp_path = tempfile.mkstemp(prefix='ban_database.', suffix='.tmp', dir=data_dir)
+    os.close(fd)
+    try:
+        shutil.copyfile(ban_db_path, tmp_path)
+        publish_ban_database(server, tmp_path)
+    except Exception as e:
+        server.logger.error(f'重建封禁数据库索引失败: {e}')
+        refresh_ban_index(server)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@timed_stage('download.publish')
+def publish_ban_database(server: PluginServerInterface, tmp_path: str) -> Dict[str, int]:
+    global ban_db_version
+
+    counts = validate_ban_database(tmp_path)
+    new_index = build_ban_index(tmp_path)
+
+    # 先关闭共享的只读连接再替换: Windows 下仍被打开的文件无法被 os.replace 覆盖
+    with ban_db_conn_lock:
+        close_ban_db_connection()
+        os.replace(tmp_path, ban_db_path)
+    set_ban_index(server, new_index)
+    ban_db_version += 1
+    server.logger.info(f'封禁数据库已发布 (版本 {ban_db_version}, online {counts["online"]}, offline {counts["offline"]})')
+    return counts
+
+
+@timed_stage('index.refresh')
+def refresh_ban_index(server: PluginServerInterface):
+    try:
+        new_index = build_ban_index(ban_db_path)
+    except Exception as e:
+        server.logger.error(f'构建封禁索引失败: {e}')
+        return
+
+    set_ban_index(server, new_index)
+    sizes = ', '.join(f'{table} {len(new_index[table]["player"])}' for table in BAN_TABLES)
+    server.logger.info(f'封禁索引已更新 ({sizes})')
+
+
+def set_ban_index(server: PluginServerInterface, new_index):
+    global ban_index, ban_bloom
+
+    # 先替换过滤器再替换索引: 新过滤器配旧索引最多多做一次精确查找, 反过来则可能放过新增的封禁
+    ban_bloom = build_ban_bloom(server, new_index)
+    # 整体替换引用, 加入检查线程要么看到旧索引要么看到新索引
+    ban_index = new_index
+    clear_verdict_cache()
+    ranges = sum(trie.count for table in BAN_TABLES for trie in new_index[table]['ranges'].values())
+    if ranges:
+        server.logger.info(f'已加载 {ranges} 个封禁 IP 网段')
+
+
+def find_ban_match(player: str, player_uuid: Optional[str], player_ip: Optional[str],
+                   player_ipv6: Optional[str]) -> Optional[Tuple[str, str]]:
+    values = {'mcuuid': player_uuid, 'player': player, 'ip': player_ip, 'ipv6': player_ipv6}
+    keys = {field: normalize_ban_key(field, value) for field, value in values.items() if value}
+    index = ban_index
+    bloom = ban_bloom
+    if bloom is not None:
+        if not any(bloom_key(field, key) in bloom for field, key in keys.items()):
+            count_bloom_result('negative')
+            # 过滤器只包含精确值, 网段仍需在前缀树中查找
+            return match_ban_index(index, values, keys, exact=False)
+        count_bloom_result('maybe')
+
+    if index is None:
+        # 索引构建完成前的回退查询只支持精确匹配
+        match = query_ban_match(player, player_uuid, player_ip, player_ipv6)
+    else:
+        match = match_ban_index(index, values, keys)
+    if bloom is not None and match is None:
+        count_bloom_result('false_positive')
+    return match
+
+
+def match_ban_index(index, values: Dict[str, Optional[str]], keys: Dict[str, object],
+                    exact: bool = True) -> Optional[Tuple[str, str]]:
+    if index is None:
+        return None
+    for table, field in BAN_MATCH_ORDER:
+        value = values[field]
+        if not value:
+            continue
+        if exact and keys[field] in index[table][field]:
+            return table, field
+        trie = index[table]['ranges'].get(field)
+        if trie is not None and trie.longest_match(value) is not None:
+            return table, field
+    return None
+
+
+def find_ban_range(table: str, field: str, address: str) -> Optional[str]:
+    index = ban_index
+    if index is None:
+        return None
+    trie = index[table]['ranges'].get(field)
+    return trie.longest_match(address) if trie is not None else None
+
+
+def find_ban_matches(identities: Dict[str, Dict[str, Optional[str]]]) -> Dict[str, Optional[Tuple[str, str]]]:
+    cache_size = config.get('verdict_cache_size', 4096) if config else 0
+    if cache_size <= 0:
+        return compute_ban_matches(identities)
+
+    # 先读取版本号再查询索引: 发布新数据库时先替换索引后递增版本, 带新版本号的结果一定来自新索引
+    version = ban_db_version
+    now = time.monotonic()
+    results = {}
+    misses = {}
+    with verdict_cache_lock:
+        generation = verdict_cache_generation
+        for player, info in identities.items():
+            key = verdict_key(player, info)
+            entry = verdict_cache.get(key)
+            if entry is not None and entry[0] == version and entry[1] > now:
+                verdict_cache.move_to_end(key)
+                results[player] = entry[2]
+            else:
+                if entry is not None:
+                    del verdict_cache[key]
+                misses[player] = info
+        verdict_cache_stats['hit'] += len(results)
+        verdict_cache_stats['miss'] += len(misses)
+
+    if misses:
+        computed = compute_ban_matches(misses)
+        results.update(computed)
+        expires = now + config.get('verdict_cache_ttl', 600)
+        with verdict_cache_lock:
+            # 计算期间缓存被清空(数据库已更新)时不写回, 避免旧结果留在缓存中
+            if generation == verdict_cache_generation:
+                for player, match in computed.items():
+                    key = verdict_key(player, misses[player])
+                    verdict_cache[key] = (version, expires, match)
+                    verdict_cache.move_to_end(key)
+                while len(verdict_cache) > cache_size:
+                    verdict_cache.popitem(last=False)
+    return {player: results[player] for player in identities}
+
+
+def verdict_key(player: str, info: Dict[str, Optional[str]]) -> tuple:
+    return player, info.get('uuid'), info.get('ip'), info.get('ipv6')
+
+
+def clear_verdict_cache():
+    global verdict_cache_generation
+
+    with verdict_cache_lock:
+        verdict_cache.clear()
+        verdict_cache_generation += 1
+
+
+def compute_ban_matches(identities: Dict[str, Dict[str, Optional[str]]]) -> Dict[str, Optional[Tuple[str, str]]]:
+    if ban_index is None:
+        return query_ban_matches(identities)
+    # 内存索引的每次判断都只是哈希 / 二分查找, 逐个判断即可, 同时保留布隆过滤器统计
+    return {
+        player: find_ban_match(player, info.get('uuid'), info.get('ip'), info.get('ipv6'))
+        for player, info in identities.items()
+    }
+
+
+@contextmanager
+def ban_db_connection():
+    # 所有线程共用一个只读连接, 查询期间持有锁; 发布新版本数据库后自动重新打开
+    global ban_db_conn, ban_db_conn_key
+
+    with ban_db_conn_lock:
+        key = (ban_db_version, ban_db_path)
+        if ban_db_conn is not None and ban_db_conn_key != key:
+            ban_db_conn.close()
+            ban_db_conn = None
+        if ban_db_conn is None:
+            uri = f'file:{pathname2url(ban_db_path)}?mode=ro'
+            # 数据库只会被整体替换时可以声明 immutable 跳过加锁; 增量同步会原地修改文件, 此时不能使用
+            if not config.get('delta_sync', False):
+                uri += '&immutable=1'
+            ban_db_conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                                          cached_statements=BAN_DB_CACHED_STATEMENTS)
+            ban_db_conn.execute(f'PRAGMA mmap_size={BAN_DB_MMAP_SIZE}')
+            ban_db_conn_key = key
+        yield ban_db_conn
+
+
+def close_ban_db_connection():
+    # 调用方需持有 ban_db_conn_lock
+    global ban_db_conn, ban_db_conn_key
+
+    if ban_db_conn is not None:
+        ban_db_conn.close()
+    ban_db_conn = None
+    ban_db_conn_key = None
+
+
+def query_ban_match(player: str, player_uuid: Optional[str], player_ip: Optional[str],
+                    player_ipv6: Optional[str]) -> Optional[Tuple[str, str]]:
+    with ban_db_connection() as conn:
+        row = conn.execute(BAN_MATCH_SQL, {
+            'player': player,
+            'uuid': player_uuid or None,
+            'ip': player_ip or None,
+            'ipv6': player_ipv6 or None,
+        }).fetchone()
+    if not row or row[0] is None:
+        return None
+    table, field = row[0].split('.')
+    return table, field
+
+
+def query_ban_matches(identities: Dict[str, Dict[str, Optional[str]]]) -> Dict[str, Optional[Tuple[str, str]]]:
+    # 按匹配顺序对每个 (表, 字段) 执行一次 IN 查询, 已命中的玩家不再参与后续查询
+    matches = {player: None for player in identities}
+    values = {
+        player: {'mcuuid': info.get('uuid'), 'player': player, 'ip': info.get('ip'), 'ipv6': info.get('ipv6')}
+        for player, info in identities.items()
+    }
+    with ban_db_connection() as conn:
+        for table, field in BAN_MATCH_ORDER:
+            pending = {}
+            for player, player_values in values.items():
+                value = player_values[field]
+                if value and matches[player] is None:
+                    pending.setdefault(value, []).append(player)
+            keys = list(pending)
+            for start in range(0, len(keys), SQLITE_IN_BATCH):
+                chunk = keys[start:start + SQLITE_IN_BATCH]
+                placeholders = ', '.join('?' for _ in chunk)
+                for (value,) in conn.execute(f'SELECT DISTINCT {field} FROM {table} WHERE {field} IN ({placeholders})',
+                                             chunk):
+                    for player in pending.get(value, ()):
+                        matches[player] = table, field
+    return matches
 
 
 def register_commands(server: PluginServerInterface):
@@ -428,6 +1842,10 @@ def register_commands(server: PluginServerInterface):
     builder.command('!!ndpr reload', reload_callback)
     builder.command('!!NDPR reload', reload_callback)
 
+    # !!ndpr / !!NDPR stats
+    builder.command('!!ndpr stats', stats_callback)
+    builder.command('!!NDPR stats', stats_callback)
+
     # !!ndpr / !!NDPR cu / checkupdate
     builder.command('!!ndpr cu', check_update_callback)
     builder.command('!!ndpr checkupdate', check_update_callback)
@@ -440,6 +1858,7 @@ def register_commands(server: PluginServerInterface):
     builder.register(server)
 
 
+@timed_stage('command.help')
 def help_callback(src, ctx):
     src.reply('§6========== §bNDPR 封禁系统 §6==========')
     src.reply(f'§e版本:v{version}')
@@ -452,6 +1871,7 @@ def help_callback(src, ctx):
     src.reply('§f!!ndpr ban <ID> <原因> §7- 提交封禁审核(如有上传权限)')
     src.reply('§f!!ndpr check <ID/IP/UUID> §7- 检查封禁状态')
     src.reply('§f!!ndpr reload §7- 重载插件')
+    src.reply('§f!!ndpr stats §7- 显示运行统计和各阶段耗时')
     src.reply('§f!!ndpr cu / checkupdate §7- 检查插件更新')
     src.reply('')
     src.reply('© 2026 NDPR Team')
@@ -459,6 +1879,7 @@ def help_callback(src, ctx):
 def reload_callback(src, ctx):
     reload_plugin(src, src.get_server())
 
+@timed_stage('command.download')
 def download_callback(src, ctx):
     src.reply('§e正在下载封禁数据库...')
     download_ban_database(src.get_server(), src)
@@ -470,13 +1891,16 @@ def ban_callback(src, ctx):
     if player:
         add_ban_player(src, player, reason)
 
+@timed_stage('command.check')
 def check_callback(src, ctx):
     target = ctx.get('target')
     if target:
-        if target.count('.') >= 3 and ':' in target:  # IPv4
-            check_ban_by_identifier(src, 'ip', target)
-        elif target.count(':') > 1:  # IPv6
-            check_ban_by_identifier(src, 'ipv6', target)
+        try:
+            address = ipaddress.ip_address(target)
+        except ValueError:
+            address = None
+        if address is not None:  # IPv4 / IPv6
+            check_ban_by_identifier(src, 'ip' if address.version == 4 else 'ipv6', target)
         elif len(target) == 36 and target.count('-') == 4:  # UUID
             check_ban_by_identifier(src, 'uuid', target)
         else:  # ID
@@ -490,55 +1914,101 @@ def check_ban_by_identifier(src, identifier_type: str, value: str):
         src.reply('§c无数据')
         return
 
+    field = {'ip': 'ip', 'ipv6': 'ipv6', 'uuid': 'mcuuid'}[identifier_type]
     try:
-        conn = sqlite3.connect(ban_db_path)
-        cursor = conn.cursor()
-        tables_to_check = ['online', 'offline']
         found = False
-
-        for table in tables_to_check:
-            if identifier_type == 'ip':
-                cursor.execute(f"SELECT player, ban_reason, ban_time FROM {table} WHERE ip = ?", (value,))
-            elif identifier_type == 'ipv6':
-                cursor.execute(f"SELECT player, ban_reason, ban_time FROM {table} WHERE ipv6 = ?", (value,))
-            elif identifier_type == 'uuid':
-                cursor.execute(f"SELECT player, ban_reason, ban_time FROM {table} WHERE mcuuid = ?", (value,))
-
-            result = cursor.fetchone()
-            if result:
-                found = True
-                src.reply(f'§7玩家: {result[0]}')
-                src.reply(f'§7原因: {result[1]}')
-                src.reply(f'§7封禁时间: {result[2]}')
-                break
+        with ban_db_connection() as conn:
+            for table in BAN_TABLES:
+                result = conn.execute(BAN_DETAIL_SQL[table, field], (value,)).fetchone()
+                ban_range = None
+                if not result and field in BAN_RANGE_FIELDS:
+                    ban_range = find_ban_range(table, field, value)
+                    if ban_range:
+                        result = conn.execute(BAN_DETAIL_SQL[table, field], (ban_range,)).fetchone()
+                if result:
+                    found = True
+                    if ban_range:
+                        src.reply(f'§7命中封禁网段: {ban_range}')
+                    src.reply(f'§7玩家: {result[0]}')
+                    src.reply(f'§7原因: {result[1]}')
+                    src.reply(f'§7封禁时间: {result[2]}')
+                    break
 
         if not found:
             src.reply(f'§a未找到封禁记录 ({identifier_type}: {value})')
-
-        conn.close()
     except Exception as e:
         src.reply(f'§c查询失败: {e}')
 
 
+@timed_stage('command.checkupdate')
 def check_update_callback(src, ctx):
     check_plugin_update(src.get_server(), src)
 
 
+@timed_stage('command.stats')
+def stats_callback(src, ctx):
+    src.reply('§6========== §bNDPR 运行统计 §6==========')
+    if startup_timings:
+        load_kind = '重载' if startup_timings.get('load_kind') == 'reload' else '冷启动'
+        src.reply(f'§e启动: §f{load_kind} 加载 {startup_timings.get("load_ms", 0):.1f} ms, '
+                  f'索引 {startup_timings.get("index_ms", 0):.1f} ms, 就绪 {startup_timings.get("ready_ms", 0):.1f} ms')
+    index = ban_index
+    if index is not None:
+        sizes = ', '.join(f'{table} {len(index[table]["player"])}' for table in BAN_TABLES)
+        src.reply(f'§e封禁数据库: §f版本 {str(ban_db_meta.get("version", "-"))[:12]}, {sizes}')
+    else:
+        src.reply('§e封禁数据库: §f索引未加载')
+    bloom_summary = format_bloom_stats()
+    if bloom_summary:
+        src.reply(f'§e布隆过滤器: §f{bloom_summary}')
+    with verdict_cache_lock:
+        hits, misses, entries = verdict_cache_stats['hit'], verdict_cache_stats['miss'], len(verdict_cache)
+    if hits + misses:
+        src.reply(f'§e判定缓存: §f命中 {hits} 次 ({hits / (hits + misses):.1%}), 未命中 {misses} 次, 当前 {entries} 条')
+    with pending_kicks_lock:
+        src.reply(f'§e拦截: §f本次运行踢出 {kicks_total} 人, 已上报 {kicks_reported}, 待上报 {pending_kicks}')
+
+    snapshot = get_stage_stats()
+    if not snapshot:
+        return
+    src.reply(f'§b各阶段耗时 (最近 {STAGE_SAMPLE_WINDOW} 次):')
+    for stage, stats in snapshot.items():
+        src.reply(f'§f{stage} §7次数 {stats["count"]}, p50 {stats["p50"] * 1000:.2f} ms, '
+                  f'p99 {stats["p99"] * 1000:.2f} ms, 最大 {stats["max"] * 1000:.2f} ms')
+
+
 @new_thread('NDPR')
+@timed_stage('command.reload')
 def reload_plugin(src, server: PluginServerInterface):
     global config
+    previous_config = config
     try:
         src.reply('§e正在重载 NDPR 插件...')
         src.reply('§7正在重新加载配置文件...')
-        init_config(server)
+        try:
+            init_config(server)
+        except Exception:
+            # 新配置无效时继续按原配置运行, 写入线程等组件不受影响
+            config = previous_config
+            raise
+        if not config.get('uuid'):
+            obtain_uuid(server)
+        init_http_session(server)
+        setup_logger(server)
+        start_log_tailer(server)
+        if ban_index is not None:
+            # 布隆过滤器参数可能已修改, 按新配置重建
+            set_ban_index(server, ban_index)
         src.reply('§7正在下载封禁数据库...')
-        download_ban_database(server, src)
+        synced = download_ban_database(server, src)
+        start_download_task(server, 0 if synced else 1)
         src.reply('§aNDPR插件已重载')
     except Exception as e:
         src.reply(f'§c重载失败: {e}')
 
 
 @new_thread('NDPR')
+@timed_stage('command.ban')
 def add_ban_player(src, player: str, reason: str = None):
     global config
 
@@ -611,7 +2081,7 @@ def add_ban_player(src, player: str, reason: str = None):
         src.get_server().logger.info(f'正在提交封禁审核到 {url}')
         src.get_server().logger.info(f'请求数据: {data}')
 
-        response = requests.post(url, headers=headers, json=data, timeout=10)
+        response = http().post(url, headers=headers, json=data, timeout=HTTP_TIMEOUTS['ban'])
 
         src.get_server().logger.info(f'API响应状态码: {response.status_code}')
         src.get_server().logger.info(f'API响应内容: {response.text}')
@@ -645,47 +2115,158 @@ def add_ban_player(src, player: str, reason: str = None):
         traceback.print_exc()
 
 
-@new_thread('NDPR')
-def save_player_info(player: str, ip: Optional[str], uuid: Optional[str], ipv6: Optional[str]):
-    global player_info_path
+def init_player_store(server: PluginServerInterface):
+    global player_db
 
-    try:
-        player_info = {}
-        if os.path.exists(player_info_path):
-            with open(player_info_path, 'r', encoding='utf-8') as f:
-                player_info = json.load(f)
-
-        player_info[player] = {
-            'ip': ip,
-            'uuid': uuid,
-            'ipv6': ipv6,
-            'timestamp': __import__('time').time()
-        }
+    close_player_store()
+    conn = sqlite3.connect(player_db_path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS players ('
+        'player TEXT PRIMARY KEY, ip TEXT, uuid TEXT, ipv6 TEXT, timestamp REAL)'
+    )
+    conn.commit()
+    player_db = conn
+    migrate_player_info_json(server)
 
-        with open(player_info_path, 'w', encoding='utf-8') as f:
-            json.dump(player_info, f, indent=2, ensure_ascii=False)
 
-        print(f'已保存玩家 {player} 信息到 {player_info_path}')
+def migrate_player_info_json(server: PluginServerInterface):
+    # 一次性把旧版 player_info.json 导入数据库, 完成后改名保留备份
+    if not os.path.exists(player_info_path):
+        return
+
+    try:
+        with open(player_info_path, 'r', encoding='utf-8') as f:
+            player_info = json.load(f)
+
+        rows = [
+            (player, info.get('ip'), info.get('uuid'), info.get('ipv6'), info.get('timestamp'))
+            for player, info in player_info.items()
+        ]
+        with player_db_lock:
+            with player_db:
+                player_db.executemany(
+                    'INSERT OR IGNORE INTO players (player, ip, uuid, ipv6, timestamp) VALUES (?, ?, ?, ?, ?)',
+                    rows
+                )
+        os.replace(player_info_path, player_info_path + '.bak')
+        server.logger.info(f'已将 {len(rows)} 条玩家信息迁移到 {player_db_path}')
     except Exception as e:
-        print(f'保存玩家信息失败: {e}')
+        server.logger.error(f'迁移玩家信息失败: {e}')
 
 
-def load_player_info(player: str) -> Dict[str, Optional[str]]:
-    global player_info_path
+def close_player_store():
+    global player_db
 
-    if not os.path.exists(player_info_path):
-        print(f'数据文件不存在: {player_info_path}')
-        return {}
+    with player_db_lock:
+        if player_db is not None:
+            player_db.close()
+        player_db = None
+
+
+def start_player_writer(server: PluginServerInterface):
+    global player_write_queue, player_writer
 
+    player_write_queue = queue.Queue(maxsize=PLAYER_WRITE_QUEUE_SIZE)
+    player_writer = run_player_writer(server, player_write_queue)
+
+
+def stop_player_writer(server: PluginServerInterface):
+    global player_write_queue, player_writer
+
+    if player_writer is None:
+        return
     try:
-        with open(player_info_path, 'r', encoding='utf-8') as f:
-            player_info = json.load(f)
+        player_write_queue.put(None, timeout=5)
+        player_writer.join(timeout=10)
+    except queue.Full:
+        server.logger.warning('玩家信息写入队列已满, 未能正常停止写入线程')
+    if player_writer.is_alive():
+        server.logger.warning('玩家信息写入线程未能在超时内退出')
+    player_writer = None
+    player_write_queue = None
+
+
+@new_thread('NDPR_PlayerWriter')
+def run_player_writer(server: PluginServerInterface, write_queue: queue.Queue):
+    # 唯一的写入线程: 合并同一玩家的多次更新, 按批量大小或时间间隔批量落盘
+    deadline = None
+    while True:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            item = write_queue.get(timeout=timeout)
+        except queue.Empty:
+            item = False
 
+        if item is None:
+            flush_player_writes(server)
+            return
+        if item:
+            player, row = item
+            with pending_player_lock:
+                pending_player_writes[player] = row
+                pending_count = len(pending_player_writes)
+            if deadline is None:
+                deadline = time.monotonic() + PLAYER_FLUSH_INTERVAL
+            if pending_count < PLAYER_FLUSH_BATCH and time.monotonic() < deadline:
+                continue
 
-        if player in player_info:
-            return player_info[player]
+        if flush_player_writes(server):
+            deadline = None
         else:
-            pass
+            deadline = time.monotonic() + PLAYER_FLUSH_INTERVAL
+
+
+def flush_player_writes(server: PluginServerInterface) -> bool:
+    with pending_player_lock:
+        batch = dict(pending_player_writes)
+    if not batch:
+        return True
+
+    try:
+        with player_db_lock:
+            with player_db:
+                player_db.executemany(
+                    'INSERT OR REPLACE INTO players (player, ip, uuid, ipv6, timestamp) VALUES (?, ?, ?, ?, ?)',
+                    [(player,) + row for player, row in batch.items()]
+                )
+    except Exception as e:
+        server.logger.error(f'保存玩家信息失败: {e}')
+        return False
+
+    with pending_player_lock:
+        for player, row in batch.items():
+            if pending_player_writes.get(player) is row:
+                del pending_player_writes[player]
+    return True
+
+
+def save_player_info(player: str, ip: Optional[str], uuid: Optional[str], ipv6: Optional[str]):
+    if player_write_queue is None:
+        print(f'保存玩家信息失败: 写入线程未启动')
+        return
+
+    try:
+        player_write_queue.put((player, (ip, uuid, ipv6, time.time())), timeout=1)
+    except queue.Full:
+        print(f'保存玩家信息失败: 写入队列已满, 丢弃玩家 {player} 的更新')
+
+
+def load_player_info(player: str) -> Dict[str, Optional[str]]:
+    with pending_player_lock:
+        row = pending_player_writes.get(player)
+    if row:
+        return {'ip': row[0], 'uuid': row[1], 'ipv6': row[2], 'timestamp': row[3]}
+
+    try:
+        with player_db_lock:
+            row = player_db.execute(
+                'SELECT ip, uuid, ipv6, timestamp FROM players WHERE player = ?', (player,)
+            ).fetchone()
+
+        if row:
+            return {'ip': row[0], 'uuid': row[1], 'ipv6': row[2], 'timestamp': row[3]}
     except Exception as e:
         print(f'加载玩家信息失败: {e}')
 
@@ -703,19 +2284,12 @@ def check_ban_status(src, player: str):
     table_name = 'online' if is_online else 'offline'
 
     try:
-        conn = sqlite3.connect(ban_db_path)
-        cursor = conn.cursor()
-        if is_online:
-            cursor.execute("SELECT ip, ban_reason, ban_time FROM online WHERE player = ?", (player,))
-        else:
-            cursor.execute("SELECT ip, ban_reason, ban_time FROM offline WHERE player = ?", (player,))
-
-        result = cursor.fetchone()
-        conn.close()
+        with ban_db_connection() as conn:
+            result = conn.execute(BAN_DETAIL_SQL[table_name, 'player'], (player,)).fetchone()
 
         if result:
             src.reply(f'§c玩家 {player} 已被封禁')
-            src.reply(f'§7IP: {result[0]}')
+            src.reply(f'§7IP: {result[3]}')
             src.reply(f'§7原因: {result[1]}')
             src.reply(f'§7封禁时间: {result[2]}')
         else:
@@ -723,98 +2297,115 @@ def check_ban_status(src, player: str):
     except Exception as e:
         src.reply(f'§c查询失败: {e}')
 
-def get_player_info_from_log(player: str) -> Dict[str, Optional[str]]:
-    import re
-    from datetime import datetime, timedelta
-
+def resolve_log_path() -> str:
     log_path = config.get('log_path', 'server/logs/latest.log')
 
     if not os.path.isabs(log_path):
         plugin_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         mcdr_root = os.path.dirname(plugin_dir)
         log_path = os.path.join(mcdr_root, log_path)
+    return log_path
+
+
+def read_log_lines_reversed(log_path: str):
+    # 从文件末尾按块向前读取, 只需要解析最近几分钟的日志, 不必读完整个文件
+    with open(log_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b''
+        while position > 0:
+            read_size = min(LOG_READ_CHUNK_SIZE, position)
+            position -= read_size
+            f.seek(position)
+            chunk = f.read(read_size) + remainder
+            lines = chunk.split(b'\n')
+            remainder = lines[0]
+            for line in reversed(lines[1:]):
+                yield line.decode('utf-8', errors='ignore')
+        yield remainder.decode('utf-8', errors='ignore')
+
 
-    print(f'正在从日志文件获取玩家 {player} 的信息: {log_path}')
+def get_player_info_from_log(player: str) -> Dict[str, Optional[str]]:
+    return get_players_info_from_log([player])[player]
+
+
+@timed_stage('join.log_scan')
+def get_players_info_from_log(players: List[str]) -> Dict[str, Dict[str, Optional[str]]]:
+    from datetime import datetime, timedelta
+
+    log_path = resolve_log_path()
+
+    print(f'正在从日志文件获取玩家 {", ".join(players)} 的信息: {log_path}')
 
     if not os.path.exists(log_path):
         print(f'日志文件不存在: {log_path}')
-        return {}
+        return {player: {} for player in players}
 
     try:
-        with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
-        two_minutes_ago = datetime.now() - timedelta(minutes=2)
-
-        result = {
-            'ip': None,
-            'uuid': None,
-            'ipv6': None
+        results = {
+            player: {
+                'ip': None,
+                'uuid': None,
+                'ipv6': None
+            }
+            for player in players
         }
 
-        five_minutes_ago = datetime.now() - timedelta(minutes=5)
-        matching_lines = []
+        now = datetime.now()
+        five_minutes_ago = now - timedelta(minutes=5)
+        matched = set()
+        pending = list(players)
 
-        for line in reversed(lines):
-            time_match = re.search(r'\[(\d{2}:\d{2}:\d{2})\]', line)
+        # 倒序扫描一次, 同时提取所有玩家的 UUID / IP / IPv6, 取最近一次记录
+        for line in read_log_lines_reversed(log_path):
+            time_match = LOG_TIME_PATTERN.search(line)
             if not time_match:
                 continue
 
-            time_str = time_match.group(1)
             try:
-                log_time = datetime.strptime(time_str, '%H:%M:%S')
-                log_time = log_time.replace(year=datetime.now().year,
-                                           month=datetime.now().month,
-                                           day=datetime.now().day)
-
-                if log_time < five_minutes_ago:
-                    continue
+                log_time = datetime.strptime(time_match.group(1), '%H:%M:%S')
+                log_time = log_time.replace(year=now.year, month=now.month, day=now.day)
             except ValueError:
                 continue
+            if log_time < five_minutes_ago:
+                break
 
-            if player in line:
-                matching_lines.append(line.strip())
-
-            if player in line and ('UUID' in line or 'uuid' in line):
-                uuid_match = re.search(r'UUID of player (\w+) is ([a-fA-F0-9-]{36})', line)
-                if uuid_match and uuid_match.group(1) == player:
-                    result['uuid'] = uuid_match.group(2)
-                    continue
-
-                uuid_match = re.search(rf'{re.escape(player)}[^[]*\[([a-fA-F0-9-]{{36}})\]', line)
-                if uuid_match:
-                    result['uuid'] = uuid_match.group(1)
-                    continue
-
-                uuid_match = re.search(r'([a-fA-F0-9-]{36})', line)
-                if uuid_match:
-                    result['uuid'] = uuid_match.group(1)
-                    continue
-
-            if player in line and ('joined' in line or 'logged' in line or 'logged in' in line or 'connected' in line):
-                ip_match = re.search(rf'{re.escape(player)}\[/([0-9.:]+):', line)
-                if ip_match:
-                    ip = ip_match.group(1)
-                    if ':' in ip and ip.count(':') > 1:
-                        result['ipv6'] = ip
-                    else:
-                        result['ip'] = ip
-                    continue
-
-                ip_match = re.search(rf'{re.escape(player)}[^0-9]*([0-9]{{1,3}}\.[0-9]{{1,3}}\.[0-9]{{1,3}}\.[0-9]{{1,3}})', line)
-                if ip_match:
-                    result['ip'] = ip_match.group(1)
-                    continue
-
-        if not matching_lines:
-            print(f'警告: 在最近的日志中未找到包含玩家 {player} 的任何记录')
+            line_players = [player for player in pending if player in line]
+            if not line_players:
+                continue
+            # 与 on_info / 日志读取器使用相同的解析规则, 只接受服务器输出的登录行和 UUID 行
+            line_events = parse_identity_line(line)
+
+            for player in line_players:
+                matched.add(player)
+                result = results[player]
+
+                for name, field, value in line_events:
+                    if name != player or field == 'joined':
+                        continue
+                    if field == 'uuid':
+                        if result['uuid'] is None:
+                            result['uuid'] = value
+                    elif result['ip'] is None and result['ipv6'] is None:
+                        result[field] = value
+
+                if result['uuid'] is not None and (result['ip'] is not None or result['ipv6'] is not None):
+                    pending.remove(player)
+
+            if not pending:
+                break
 
-        print(f'最终结果: IP={result["ip"]}, UUID={result["uuid"]}, IPv6={result["ipv6"]}')
-        return result
+        for player in players:
+            if player not in matched:
+                print(f'警告: 在最近的日志中未找到包含玩家 {player} 的任何记录')
+            result = results[player]
+            print(f'最终结果 ({player}): IP={result["ip"]}, UUID={result["uuid"]}, IPv6={result["ipv6"]}')
+        return results
     except Exception as e:
         print(f'读取日志时出错: {e}')
         import traceback
         traceback.print_exc()
-        return {}
+        return {player: {} for player in players}
 
 
 def get_player_ip(player: str) -> Optional[str]:
@@ -832,6 +2423,214 @@ def get_player_ipv6(player: str) -> Optional[str]:
     return info.get('ipv6')
 
 
+def parse_custom_identity_content(content: str) -> List[Tuple[str, str, Optional[str]]]:
+    # 行结构与原版相同, IP 和 UUID 取自服务器输出本身, logger_format 只用来从名称部分读取 %name%
+    if content.startswith('UUID of player'):
+        match = LOG_CUSTOM_UUID_LINE_PATTERN.match(content)
+        field = 'uuid'
+    elif 'logged in' in content:
+        match = LOG_CUSTOM_LOGIN_PATTERN.match(content)
+        field = 'ip'
+    elif content.endswith('joined the game'):
+        match = LOG_CUSTOM_JOIN_PATTERN.match(content)
+        field = 'joined'
+    else:
+        return []
+    if match is None:
+        return []
+
+    name_match = custom_log_matcher.match(match.group(1))
+    if name_match is None or not name_match.group('name'):
+        return []
+    player = name_match.group('name')
+    if field == 'joined':
+        return [(player, 'joined', None)]
+    value = match.group(2)
+    if field == 'ip' and value.count(':') > 1:
+        field = 'ipv6'
+    return [(player, field, value)]
+
+
+def parse_identity_line(line: str) -> List[Tuple[str, str, Optional[str]]]:
+    # 日志文件中的行: 先确认是服务器线程输出的, 再去掉前缀解析内容
+    prefix = LOG_SERVER_PREFIX_PATTERN.match(line)
+    if prefix is None:
+        return []
+    return parse_identity_content(line[prefix.end():].rstrip('\r'))
+
+
+def parse_identity_content(content: str) -> List[Tuple[str, str, Optional[str]]]:
+    if custom_log_matcher is not None:
+        events = parse_custom_identity_content(content)
+        if events:
+            return events
+
+    if content.startswith('UUID of player'):
+        match = LOG_UUID_LINE_PATTERN.match(content)
+        if match:
+            return [(match.group(1), 'uuid', match.group(2))]
+    elif 'logged in' in content:
+        match = LOG_LOGIN_PATTERN.match(content)
+        if match:
+            ip = match.group(2)
+            return [(match.group(1), 'ipv6' if ip.count(':') > 1 else 'ip', ip)]
+    elif content.endswith('joined the game'):
+        match = LOG_JOIN_PATTERN.match(content)
+        if match:
+            return [(match.group(1), 'joined', None)]
+    return []
+
+
+def record_identity(player: str, field: str, value: Optional[str]):
+    with recent_identities_lock:
+        entry = recent_identities.pop(player, None)
+        if entry is None or time.time() - entry['timestamp'] > RECENT_IDENTITY_TTL:
+            entry = {'uuid': None, 'ip': None, 'ipv6': None, 'joined': False}
+        if field == 'joined':
+            entry['joined'] = True
+        else:
+            entry[field] = value
+            # 一次登录只会有 IPv4 或 IPv6 其中之一
+            if field == 'ip':
+                entry['ipv6'] = None
+            elif field == 'ipv6':
+                entry['ip'] = None
+        entry['timestamp'] = time.time()
+        recent_identities[player] = entry
+        while len(recent_identities) > RECENT_IDENTITY_LIMIT:
+            recent_identities.popitem(last=False)
+
+
+def get_recent_identity(player: str) -> Optional[Dict[str, Optional[str]]]:
+    with recent_identities_lock:
+        entry = recent_identities.get(player)
+        if entry is None or time.time() - entry['timestamp'] > RECENT_IDENTITY_TTL:
+            return None
+        return {'ip': entry['ip'], 'uuid': entry['uuid'], 'ipv6': entry['ipv6']}
+
+
+class LogTailer:
+    """
+    常驻的日志增量读取器, 记录文件偏移和 inode, 每次只读取新追加的内容
+    日志轮转(inode 变化)或被截断时自动切换到新文件并从头读取
+    """
+
+    def __init__(self, log_path: str):
+        self.log_path = log_path
+        self.file = None
+        self.file_id = None
+        self.offset = 0
+        self.remainder = b''
+        self.lock = threading.Lock()
+
+    def _open(self, bootstrap: bool):
+        self.file = open(self.log_path, 'rb')
+        stat = os.fstat(self.file.fileno())
+        self.file_id = (stat.st_dev, stat.st_ino)
+        self.offset = 0
+        self.remainder = b''
+        if bootstrap and stat.st_size > LOG_TAILER_BOOTSTRAP_BYTES:
+            # 首次打开时只回看末尾一段
+            self._skip_to_tail(stat.st_size)
+
+    def _skip_to_tail(self, size: int):
+        # 跳到末尾 LOG_TAILER_BOOTSTRAP_BYTES 处, 并丢弃不完整的首行
+        self.offset = size - LOG_TAILER_BOOTSTRAP_BYTES
+        self.remainder = b''
+        self.file.seek(self.offset)
+        skipped = self.file.readline()
+        self.offset += len(skipped)
+
+    def _close_file(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+        self.file_id = None
+
+    def _read_new(self) -> int:
+        size = os.fstat(self.file.fileno()).st_size
+        if size - self.offset > LOG_TAILER_BOOTSTRAP_BYTES:
+            # 长时间未轮询时积压的旧日志早已超过身份缓存的有效期, 直接跳过
+            self._skip_to_tail(size)
+        self.file.seek(self.offset)
+        count = 0
+        # 按块读取, 内存占用不随积压量增长
+        while True:
+            data = self.file.read(LOG_READ_CHUNK_SIZE)
+            if not data:
+                return count
+            self.offset += len(data)
+            lines = (self.remainder + data).split(b'\n')
+            self.remainder = lines.pop()
+            for line in lines:
+                for event in parse_identity_line(line.decode('utf-8', errors='ignore')):
+                    record_identity(*event)
+            count += len(lines)
+
+    def poll(self) -> int:
+        with self.lock:
+            try:
+                stat = os.stat(self.log_path)
+            except OSError:
+                return 0
+
+            count = 0
+            if self.file is None:
+                self._open(bootstrap=True)
+            elif (stat.st_dev, stat.st_ino) != self.file_id:
+                # 日志已轮转, 先读完旧文件剩余内容再切换
+                count += self._read_new()
+                self._close_file()
+                self._open(bootstrap=False)
+            elif stat.st_size < self.offset:
+                # 日志被截断
+                self.offset = 0
+                self.remainder = b''
+
+            count += self._read_new()
+            return count
+
+    def close(self):
+        with self.lock:
+            self._close_file()
+
+
+def start_log_tailer(server: PluginServerInterface):
+    global log_tailer
+
+    if log_tailer is not None:
+        log_tailer.close()
+    log_tailer = LogTailer(resolve_log_path())
+    try:
+        lines = log_tailer.poll()
+        server.logger.info(f'日志读取器已启动: {log_tailer.log_path} (已解析 {lines} 行)')
+    except Exception as e:
+        server.logger.warning(f'日志读取器启动失败: {e}')
+
+
+def lookup_player_identity(player: str) -> Dict[str, Optional[str]]:
+    return lookup_player_identities([player])[player]
+
+
+@timed_stage('join.identity')
+def lookup_player_identities(players: List[str]) -> Dict[str, Dict[str, Optional[str]]]:
+    # 整批只读取一次日志: 先增量解析新内容, 仍缺身份信息的玩家再合并做一次倒序扫描
+    identities = {}
+    if log_tailer is not None:
+        try:
+            log_tailer.poll()
+        except Exception as e:
+            print(f'增量读取日志失败: {e}')
+        for player in players:
+            identity = get_recent_identity(player)
+            if identity is not None and (identity['uuid'] or identity['ip'] or identity['ipv6']):
+                identities[player] = identity
+    missing = [player for player in players if player not in identities]
+    if missing:
+        identities.update(get_players_info_from_log(missing))
+    return identities
+
+
 def check_plugin_update(server: PluginServerInterface, src=None):
     current_version = version
     api_url = 'https://api.github.com/repos/NDPReforged/NDPR-MCDR/releases/latest'
@@ -847,7 +2646,7 @@ def check_plugin_update(server: PluginServerInterface, src=None):
             send_message("§a[NDPR] 正在检查更新...")
         server.logger.info("正在检查更新...")
 
-        response = requests.get(api_url, timeout=30)
+        response = http().get(api_url, timeout=HTTP_TIMEOUTS['update'])
         response.raise_for_status()
         data = response.json()
 
@@ -906,116 +2705,320 @@ def check_plugin_update(server: PluginServerInterface, src=None):
         server.logger.error(f"检查更新失败: {str(e)}")
 
 def report_kick(server: PluginServerInterface):
-    global config
+    # 只在内存中计数, 由后台线程定期批量上报, 不阻塞加入检查
+    global pending_kicks, kicks_total
+
+    with pending_kicks_lock:
+        pending_kicks += 1
+        kicks_total += 1
+
+
+@timed_stage('kick.report')
+def flush_kick_reports(server: PluginServerInterface) -> bool:
+    global pending_kicks, kicks_reported
+
+    with pending_kicks_lock:
+        count = pending_kicks
+    if count == 0:
+        return True
+    if not config.get('token') or not config.get('api_url'):
+        return False
+
+    # 服务端 /stats/a 每个请求记一次拦截, 因此逐次上报; 请求在后台线程中发出, 复用连接池
+    url = f"{config['api_url']}/stats/a"
+    headers = {
+        'Content-Type': 'application/json'
+    }
+    data = {
+        'token': config['token']
+    }
+    for _ in range(count):
+        if plugin_stopping.is_set():
+            break
+        try:
+            response = http().post(url, headers=headers, json=data, timeout=HTTP_TIMEOUTS['stats'])
+            if response.status_code != 200:
+                server.logger.warning(f'拦截统计上报失败: HTTP {response.status_code}')
+                save_kick_stats(server)
+                return False
+        except Exception as e:
+            server.logger.warning(f'拦截统计上报异常: {e}')
+            save_kick_stats(server)
+            return False
+
+        with pending_kicks_lock:
+            pending_kicks -= 1
+            kicks_reported += 1
+    save_kick_stats(server)
+    return True
 
+
+def load_kick_stats(server: PluginServerInterface):
+    global pending_kicks
+
+    if not os.path.exists(kick_stats_path):
+        return
     try:
-        url = f"{config['api_url']}/stats/a"
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        data = {
-            'token': config['token']
-        }
+        with open(kick_stats_path, 'r', encoding='utf-8') as f:
+            saved = json.load(f).get('pending', 0)
+        with pending_kicks_lock:
+            pending_kicks += saved
+    except Exception as e:
+        server.logger.warning(f'读取未上报的拦截统计失败: {e}')
 
-        response = requests.post(url, headers=headers, json=data, timeout=5)
 
-        if response.status_code == 200:
-            result = response.json()
-            total = result.get('total', 0)
-        else:
-            server.logger.warning(f'拦截统计上报失败: HTTP {response.status_code}')
+def save_kick_stats(server: PluginServerInterface):
+    with pending_kicks_lock:
+        count = pending_kicks
+    try:
+        if count == 0:
+            if os.path.exists(kick_stats_path):
+                os.remove(kick_stats_path)
+            return
+        tmp_path = kick_stats_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'pending': count}, f)
+        os.replace(tmp_path, kick_stats_path)
     except Exception as e:
-        server.logger.warning(f'拦截统计上报异常: {e}')
+        server.logger.warning(f'保存未上报的拦截统计失败: {e}')
+
+
+def start_kick_reporter(server: PluginServerInterface):
+    global kick_reporter, kick_reporter_stop
+
+    load_kick_stats(server)
+    kick_reporter_stop = threading.Event()
+    kick_reporter = run_kick_reporter(server, kick_reporter_stop)
+
+
+def stop_kick_reporter(server: PluginServerInterface):
+    global pending_kicks, kick_reporter, kick_reporter_stop
+
+    if kick_reporter is None:
+        return
+    kick_reporter_stop.set()
+    kick_reporter.join(timeout=10)
+    kick_reporter = None
+    kick_reporter_stop = None
+    # 卸载时不再发起网络请求, 未上报的数量写入文件, 下次加载后继续上报
+    save_kick_stats(server)
+    write_prometheus_metrics(server)
+    with pending_kicks_lock:
+        pending_kicks = 0
+
+
+@new_thread('NDPR_KickReporter')
+def run_kick_reporter(server: PluginServerInterface, stop_event: threading.Event):
+    # 同一个定时线程顺便写出 Prometheus 指标文件
+    write_prometheus_metrics(server)
+    while not stop_event.wait(KICK_REPORT_INTERVAL):
+        flush_kick_reports(server)
+        write_prometheus_metrics(server)
+
+
+def on_info(server: PluginServerInterface, info: Info):
+    # 玩家聊天内容不可信, 只解析服务器自身的输出
+    if not info.is_from_server or info.is_player or not info.content:
+        return
+
+    for player, field, value in parse_identity_content(info.content):
+        record_identity(player, field, value)
+        if field not in ('ip', 'ipv6'):
+            continue
+
+        # 登录行(UUID 行总在其之前)到达即可判定, 无需等待加入事件或读取日志文件
+        identity = get_recent_identity(player)
+        if identity is None or (not identity['uuid'] and config.get('onlinemode', False)):
+            continue
+        mark_login_checked(player)
+        check_player(server, player, identity)
 
 
 def on_player_joined(server: PluginServerInterface, player: str, info):
-    global ban_db_path, config, player_info_path
-    import time
-    time.sleep(2)
+    if pop_login_checked(player):
+        return
 
-    player_uuid = get_player_uuid(player)
-    player_ip = get_player_ip(player)
-    player_ipv6 = get_player_ipv6(player)
+    # 未能从 MCDR 输出中拿到完整身份信息(如非原版日志格式), 退回到读取日志文件
+    pending = join_queue
+    if pending is not None:
+        # 交给批量检查线程, 短时间内大量加入时合并为一次日志读取和一次查询
+        pending.put(player)
+        return
+    player_info = lookup_player_identity(player)
+    check_player(server, player, player_info)
 
-    server.logger.info(f'玩家 {player} - IP: {player_ip}, UUID: {player_uuid}, IPv6: {player_ipv6}')
 
-    save_player_info(player, player_ip, player_uuid, player_ipv6)
+def start_join_batcher(server: PluginServerInterface):
+    global join_queue, join_batcher
 
+    join_queue = queue.Queue()
+    join_batcher = run_join_batcher(server, join_queue)
 
-    if not os.path.exists(ban_db_path):
-        server.logger.info('封禁数据库不存在,跳过封禁检查')
+
+def stop_join_batcher(server: PluginServerInterface):
+    global join_queue, join_batcher
+
+    if join_batcher is None:
         return
+    pending = join_queue
+    join_queue = None
+    # 停止前处理完已入队的加入事件
+    pending.put(None)
+    join_batcher.join(timeout=10)
+    if join_batcher.is_alive():
+        server.logger.warning('加入检查线程未能在超时内退出')
+    join_batcher = None
+
+
+@new_thread('NDPR_JoinBatcher')
+def run_join_batcher(server: PluginServerInterface, pending: queue.Queue):
+    stopping = False
+    while not stopping:
+        player = pending.get()
+        if player is None:
+            return
+        # 第一个加入事件到达后再等待一个短窗口, 窗口内到达的玩家合并为一批
+        batch = [player]
+        deadline = time.monotonic() + JOIN_BATCH_WINDOW
+        while len(batch) < JOIN_BATCH_MAX:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                player = pending.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if player is None:
+                stopping = True
+                break
+            batch.append(player)
 
-    is_online = config.get('onlinemode', False)
-    table_name = 'online' if is_online else 'offline'
+        try:
+            process_join_batch(server, batch)
+        except Exception as e:
+            server.logger.error(f'批量检查加入玩家时出错: {e}')
 
-    try:
-        conn = sqlite3.connect(ban_db_path)
-        cursor = conn.cursor()
 
-        tables_to_check = ['online', 'offline']
+def process_join_batch(server: PluginServerInterface, players: List[str]):
+    players = list(dict.fromkeys(players))
+    if len(players) > 1:
+        server.logger.info(f'合并检查 {len(players)} 名加入的玩家')
+    check_players(server, lookup_player_identities(players))
 
-        for table in tables_to_check:
-            if table == 'online' and player_uuid:
-                cursor.execute(f"SELECT 1 FROM {table} WHERE mcuuid = ?", (player_uuid,))
-                result = cursor.fetchone()
-                if result:
-                    conn.close()
-                    server.logger.info(f'检测到被封禁玩家 {player} (UUID: {player_uuid} 匹配) 在 {table} 表, 正在踢出')
-                    server.execute(f'kick {player} §c您已被NDPR封禁系统封禁')
-                    report_kick(server)
-                    return
-
-            cursor.execute(f"SELECT 1 FROM {table} WHERE player = ?", (player,))
-            result = cursor.fetchone()
-            if result:
-                conn.close()
-                server.logger.info(f'检测到被封禁玩家 {player} (玩家名匹配) 在 {table} 表, 正在踢出')
+
+def mark_login_checked(player: str):
+    with recent_identities_lock:
+        checked_logins[player] = time.time()
+
+
+def pop_login_checked(player: str) -> bool:
+    with recent_identities_lock:
+        checked_at = checked_logins.pop(player, None)
+        now = time.time()
+        for name in [name for name, t in checked_logins.items() if now - t > LOGIN_CHECK_TTL]:
+            del checked_logins[name]
+    return checked_at is not None and now - checked_at <= LOGIN_CHECK_TTL
+
+
+def check_player(server: PluginServerInterface, player: str, player_info: Dict[str, Optional[str]],
+                 save: bool = True):
+    check_players(server, {player: player_info}, save)
+
+
+@timed_stage('join.check')
+def check_players(server: PluginServerInterface, identities: Dict[str, Dict[str, Optional[str]]],
+                  save: bool = True):
+    if save:
+        for player, player_info in identities.items():
+            player_uuid = player_info.get('uuid')
+            player_ip = player_info.get('ip')
+            player_ipv6 = player_info.get('ipv6')
+            server.logger.info(f'玩家 {player} - IP: {player_ip}, UUID: {player_uuid}, IPv6: {player_ipv6}')
+            with timed_stage('join.save'):
+                save_player_info(player, player_ip, player_uuid, player_ipv6)
+
+    if ban_index is None and not os.path.exists(ban_db_path):
+        # 首次启动时数据库还在后台下载, 下载完成后再补做检查
+        for player, player_info in identities.items():
+            if not is_ban_check_ready() and defer_check(player, player_info):
+                server.logger.info(f'封禁数据库尚未就绪, 玩家 {player} 将在同步完成后检查')
+            else:
+                server.logger.info('封禁数据库不存在,跳过封禁检查')
+        return
+
+    try:
+        with timed_stage('join.match'):
+            matches = find_ban_matches(identities)
+    except Exception as e:
+        server.logger.error(f'检测玩家 {", ".join(identities)} 时出错: {e}')
+        return
+
+    for player, match in matches.items():
+        if not match:
+            continue
+        player_info = identities[player]
+        table, field = match
+        matched_by = {
+            'mcuuid': f'UUID: {player_info.get("uuid")} 匹配',
+            'player': '玩家名匹配',
+            'ip': f'IP: {player_info.get("ip")} 匹配',
+            'ipv6': f'IPv6: {player_info.get("ipv6")} 匹配',
+        }[field]
+        server.logger.info(f'检测到被封禁玩家 {player} ({matched_by}) 在 {table} 表, 正在踢出')
+        try:
+            with timed_stage('join.kick'):
                 server.execute(f'kick {player} §c您已被NDPR封禁系统封禁')
                 report_kick(server)
-                return
+        except Exception as e:
+            server.logger.error(f'踢出玩家 {player} 时出错: {e}')
+
+def start_download_task(server: PluginServerInterface, failures: int = 0):
+    global download_task, download_task_stop
+
+    with download_task_lock:
+        stop_download_task(server)
+        # 插件卸载后不再启动新的循环, 否则该循环不会再被停止
+        if plugin_stopping.is_set():
+            return
+        interval = config.get('download_interval', 900)
+        download_task_stop = threading.Event()
+        download_task = run_download_loop(server, interval, download_task_stop, failures)
+
+
+def stop_download_task(server: PluginServerInterface):
+    global download_task, download_task_stop
+
+    with download_task_lock:
+        if download_task is None:
+            return
+        download_task_stop.set()
+        download_task.join(timeout=5)
+        if download_task.is_alive():
+            server.logger.warning('定时更新任务正在下载, 将在本次下载结束后退出')
+        download_task = None
+        download_task_stop = None
+
+
+def next_download_delay(interval: int, failures: int) -> float:
+    # 失败后按指数退避重试, 并加入随机抖动, 避免多台服务器同时请求 API
+    if failures > 0:
+        delay = min(DOWNLOAD_RETRY_BASE * 2 ** (failures - 1), DOWNLOAD_RETRY_MAX)
+    else:
+        delay = interval
+    return delay * random.uniform(1 - DOWNLOAD_JITTER_RATIO, 1 + DOWNLOAD_JITTER_RATIO)
 
-            if player_ip:
-                cursor.execute(f"SELECT 1 FROM {table} WHERE ip = ?", (player_ip,))
-                result = cursor.fetchone()
-                if result:
-                    conn.close()
-                    server.logger.info(f'检测到被封禁玩家 {player} (IP: {player_ip} 匹配) 在 {table} 表, 正在踢出')
-                    server.execute(f'kick {player} §c您已被NDPR封禁系统封禁')
-                    report_kick(server)
-                    return
-
-            if player_ipv6:
-                cursor.execute(f"SELECT 1 FROM {table} WHERE ipv6 = ?", (player_ipv6,))
-                result = cursor.fetchone()
-                if result:
-                    conn.close()
-                    server.logger.info(f'检测到被封禁玩家 {player} (IPv6: {player_ipv6} 匹配) 在 {table} 表, 正在踢出')
-                    server.execute(f'kick {player} §c您已被NDPR封禁系统封禁')
-                    report_kick(server)
-                    return
 
-        conn.close()
-    except Exception as e:
-        server.logger.error(f'检测玩家 {player} 时出错: {e}')
-
-def start_download_task(server: PluginServerInterface):
-    global download_task, config
-    download_interval = config.get('download_interval', 1800)
-    download_minutes = download_interval // 60
-    download_task = threading.Thread(
-        target=run_download_loop,
-        args=(server, download_interval),
-        daemon=True,
-        name='ndpr_download'
-    )
-    download_task.start()
 @new_thread('NDPR_DownloadLoop')
-def run_download_loop(server: PluginServerInterface, interval: int):
-    import time
+def run_download_loop(server: PluginServerInterface, interval: int, stop_event: threading.Event, failures: int = 0):
     while True:
+        delay = next_download_delay(interval, failures)
+        if failures > 0:
+            server.logger.info(f'封禁数据库更新失败 {failures} 次, {delay:.0f} 秒后重试')
+        if stop_event.wait(delay):
+            return
         try:
-            time.sleep(interval)
-            download_ban_database(server)
-        except Exception:
-            pass
+            synced = download_ban_database(server)
+        except Exception as e:
+            server.logger.error(f'定时更新封禁数据库失败: {e}')
+            synced = False
+        failures = 0 if synced else failures + 1